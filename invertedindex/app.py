@@ -1,14 +1,28 @@
-from flask import Flask, render_template, request, redirect, url_for
-from query_index import load_index, docs_with_all_terms, STOP_WORDS
-from document_scorer import score_documents
-import os, subprocess
+from flask import Flask, Response, abort, jsonify, render_template, request, redirect, url_for
+from query_index import COMPRESSED_SUFFIXES
+from index_cache import get_index
+from binary_index import BINARY_SUFFIX, is_binary_index
+from document_scorer import SCORERS, DEFAULT_SCORER
+from query_language import run_query, QuerySyntaxError
+from build_jobs import JobManager, FINISHED
+from index_pager import BinaryPage, TextPage, build_offset_index, seek_text
+from markupsafe import escape
+import os, time
 from pathlib import Path
 from datetime import datetime
 
 app = Flask(__name__)
 INDEX_DIR = "output"
 DATASET_DIR = "datasets"
+INDEX_SUFFIXES = (".txt", BINARY_SUFFIX, *(".txt" + c for c in COMPRESSED_SUFFIXES))
+# BUILD_LOCAL=1 pre-checks the form's "Run locally" box (no HDFS staging or YARN scheduling);
+# otherwise builds default to the cluster, like the build scripts
+BUILD_LOCAL = os.environ.get("BUILD_LOCAL", "0") == "1"
+# Limits for one /api/search request
+MAX_BATCH = 100
+MAX_K = 100
 current_index_path = None
+build_jobs = JobManager()
 
 def list_dataset_files():
     files = []
@@ -20,7 +34,7 @@ def list_dataset_files():
     return files
 
 def list_index_files():
-    files = [f for f in os.listdir(INDEX_DIR) if f.endswith(".txt")]
+    files = [f for f in os.listdir(INDEX_DIR) if f.endswith(INDEX_SUFFIXES)]
     files.sort(key=lambda f: os.path.getmtime(os.path.join(INDEX_DIR, f)), reverse=True)
     return files
 
@@ -34,6 +48,11 @@ def index():
         query=None,
         results=None,
         exact_matches=None,
+        scorers=list(SCORERS),
+        selected_scorer=DEFAULT_SCORER,
+        jobs=build_jobs.jobs(),
+        finished=FINISHED,
+        local_default=BUILD_LOCAL,
     )
 
 @app.route("/build", methods=["POST"])
@@ -47,22 +66,65 @@ def build_index():
     timestamp = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
     full_paths = [os.path.join(DATASET_DIR, f) for f in selected_files]
     base_name = "_".join(Path(p).stem for p in full_paths)
-    if engine == "spark":
-        output_fn = f"{timestamp}_spark_{base_name}_{reducers}.txt"
+    local = ["--local"] if request.form.get("local") else []
+    mode = "_local" if local else ""
+    if engine in ("spark", "spark-df"):
+        output_fn = f"{timestamp}_{engine.replace('-', '')}{mode}_{base_name}_{reducers}.txt"
         output_fp = os.path.join(INDEX_DIR, output_fn)
-        cmd = ["bash", "build_index_spark.sh", *full_paths, output_fp, reducers]
+        opts = local + (["--positions"] if request.form.get("positions") else [])
+        if engine == "spark-df":
+            opts += ["--engine", "dataframe"]
+        cmd = ["bash", "build_index_spark.sh", *opts, *full_paths, output_fp, reducers]
     else:
         variant = request.form.get("variant", "combiner")
-        output_fn = f"{timestamp}_{variant}_{base_name}_{reducers}.txt"
+        output_fn = f"{timestamp}_{variant}{mode}_{base_name}_{reducers}.txt"
         output_fp = os.path.join(INDEX_DIR, output_fn)
-        cmd = ["bash", "build_index.sh", *full_paths, output_fp, reducers, variant]
-    subprocess.run(cmd, check=True)
+        cmd = ["bash", "build_index.sh", *local, *full_paths, output_fp, reducers, variant]
+    build_jobs.submit(cmd, output_fn)
     return redirect(url_for("index"))
 
+@app.route("/update", methods=["POST"])
+def update_index():
+    # Indexes only documents added or changed since the index was built, as a background job
+    index_file = os.path.basename(request.form.get("index_file", ""))
+    index_fp = os.path.join(INDEX_DIR, index_file)
+    if not index_file or not os.path.isfile(index_fp):
+        return redirect(url_for("index"))
+    full_paths = [os.path.join(DATASET_DIR, f) for f in request.form.getlist("datasets")]
+    build_jobs.submit(["python3", "index_segments.py", "update", index_fp, *full_paths], index_file)
+    return redirect(url_for("index"))
+
+@app.route("/jobs")
+def list_jobs():
+    return jsonify([job.to_dict() for job in build_jobs.jobs()])
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = build_jobs.get(job_id) or abort(404)
+    # Output lines from ?offset= on; poll again with the returned next_offset
+    return jsonify(job.to_dict(request.args.get("offset", 0, type=int)))
+
+@app.route("/jobs/<job_id>/log")
+def job_log(job_id):
+    job = build_jobs.get(job_id) or abort(404)
+    offset = request.args.get("offset", 0, type=int)
+    def stream():
+        for name, line in job.follow(offset):
+            yield line if name == "stdout" else f"[stderr] {line}"
+        yield f"\n[{job.status}] exit code {job.returncode}, wall time {job.wall_time or 0:.1f}s\n"
+    return Response(stream(), mimetype="text/plain")
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    job = build_jobs.get(job_id) or abort(404)
+    cancelled = build_jobs.cancel(job_id)
+    return jsonify({"cancelled": cancelled, **job.to_dict()})
+
 @app.route("/select_index", methods=["POST"])
 def select_index():
     global current_index_path
     current_index_path = os.path.join(INDEX_DIR, request.form["index_file"])
+    get_index(current_index_path)
     return redirect(url_for("index"))
 
 @app.route("/search", methods=["POST"])
@@ -70,29 +132,117 @@ def search():
     query = request.form["query"].strip()
     if not query:
         return redirect(url_for("index"))
-    terms = [t for t in query.split() if t.lower() not in STOP_WORDS]
-    if not terms:
-        return redirect(url_for("index"))
-    scores, _ = score_documents(current_index_path, terms)
-    all_term_docs = docs_with_all_terms(load_index(current_index_path), terms)
-    top5 = sorted(scores.items(), key=lambda x: -x[1])[:5]
+    scorer = request.form.get("scorer", DEFAULT_SCORER)
+    if scorer not in SCORERS:
+        scorer = DEFAULT_SCORER
+    try:
+        result = run_query(current_index_path, query, 5, scorer)
+    except QuerySyntaxError as e:
+        result, error = None, str(e)
+    else:
+        error = None
     return render_template(
         "index.html",
         indexes=list_index_files(),
         datasets=list_dataset_files(),
         selected_index=os.path.basename(current_index_path),
         query=query,
-        results=top5,
-        exact_matches=sorted(all_term_docs),
+        query_error=error,
+        results=result.ranked if result else None,
+        exact_matches=sorted(result.matches) if result else None,
+        boolean_query=result is not None and not result.plain,
+        query_plan=result.plan if result else None,
+        scorers=list(SCORERS),
+        selected_scorer=scorer,
+        jobs=build_jobs.jobs(),
+        finished=FINISHED,
+        local_default=BUILD_LOCAL,
     )
 
+def _api_query(index_path: str, query: str, k: int, scorer: str, with_matches: bool) -> dict:
+    start = time.perf_counter()
+    try:
+        result = run_query(index_path, query, k, scorer)
+    except QuerySyntaxError as e:
+        return {"query": query, "error": str(e)}
+    out = {
+        "query": query,
+        "results": [{"doc": doc, "score": score} for doc, score in result.ranked],
+        "match_count": len(result.matches),
+        "plan": result.plan,
+    }
+    if with_matches:
+        out["matches"] = sorted(result.matches)
+    out["took_ms"] = (time.perf_counter() - start) * 1000
+    return out
+
+@app.route("/api/search", methods=["GET", "POST"])
+def api_search():
+    # Stateless: the index is named in every request, never taken from the selected one.
+    # GET ?index=..&q=..[&q=..]&k=&scorer=, or POST {"index", "query" | "queries", "k", "scorer", "matches"}
+    if request.method == "POST":
+        params = request.get_json(silent=True)
+        if not isinstance(params, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        queries = params.get("queries", [params["query"]] if "query" in params else [])
+        with_matches = bool(params.get("matches", False))
+    else:
+        params = request.args
+        queries = request.args.getlist("q")
+        with_matches = request.args.get("matches") in ("1", "true")
+
+    name = params.get("index")
+    if not isinstance(name, str) or os.path.basename(name) != name or not name.endswith(INDEX_SUFFIXES):
+        return jsonify({"error": "'index' must name a file in the output directory"}), 400
+    index_path = os.path.join(INDEX_DIR, name)
+    if not os.path.isfile(index_path):
+        return jsonify({"error": f"Index {name!r} not found"}), 404
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) for q in queries):
+        return jsonify({"error": "Give a 'query' string or a non-empty 'queries' list"}), 400
+    if len(queries) > MAX_BATCH:
+        return jsonify({"error": f"At most {MAX_BATCH} queries per request"}), 400
+    try:
+        k = int(params.get("k", 5))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'k' must be an integer"}), 400
+    if not 1 <= k <= MAX_K:
+        return jsonify({"error": f"'k' must be between 1 and {MAX_K}"}), 400
+    scorer = params.get("scorer", DEFAULT_SCORER)
+    if scorer not in SCORERS:
+        return jsonify({"error": f"'scorer' must be one of {', '.join(SCORERS)}"}), 400
+
+    responses = [_api_query(index_path, q, k, scorer, with_matches) for q in queries]
+    return jsonify({"index": name, "k": k, "scorer": scorer, "responses": responses})
+
 @app.route("/output/<filename>")
 def view_output(filename):
     path = os.path.join(INDEX_DIR, filename)
     if not os.path.exists(path):
         return "File not found", 404
-    with open(path, encoding="utf-8") as f:
-        return f"<pre>{f.read()}</pre>"
+    # ?offset= is a byte offset into the (decompressed) sorted text, or a term ordinal for
+    # binary indexes; ?prefix= jumps to where that term prefix sorts
+    offset = request.args.get("offset", 0, type=int)
+    prefix = request.args.get("prefix", "").strip()
+    if is_binary_index(path):
+        index = get_index(path)
+        page = BinaryPage(index, index.seek(prefix) if prefix else offset)
+    else:
+        # Pages come from a sorted view: the file itself, or its sorted sidecar
+        offsets = get_index(path, build_offset_index)
+        if prefix:
+            offset = seek_text(offsets, prefix)
+        page = TextPage(offsets.path, offset)
+
+    def render():
+        yield (f'<form method="get"><input name="prefix" value="{escape(prefix)}" placeholder="Jump to term prefix"> '
+               f'<button type="submit">Go</button> <a href="?offset=0">First page</a></form>')
+        yield "<pre>"
+        for line in page:
+            yield str(escape(line))
+        yield "</pre>"
+        if not page.at_end:
+            yield f'<a href="?offset={page.next_offset}">Next page</a>'
+    return Response(render(), mimetype="text/html")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,246 @@
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Iterator, Sequence
+from query_index import load_index
+
+# Layout (little-endian):
+#   header | doc offsets (u32) | doc names | term offsets (u32) | terms |
+#   max counts (u32) | doc id offsets (u64) | doc ids (u32) | counts (u32)
+# Terms and doc names are sorted so lookups are a binary search over the mmap.
+# Max counts hold each term's largest count, the upper bound top-k search skips on.
+# A term's postings are its slice of doc ids (sorted) and the counts aligned with them, so
+# conjunctive queries intersect slices of the mmap and top-k search reads any single
+# posting without decoding the ones before it.
+# Older versions still load: 1 stored only varint postings (a u64 offset table, then per
+# term varint(n) and n pairs of varint(doc id delta), varint(count)), 2 added max counts
+# and 3 the doc ids; version 4 drops the varint postings for the counts array.
+MAGIC = b"IIDX"
+VERSION = 4
+BINARY_SUFFIX = ".idx"
+_HEADERS = {1: struct.Struct("<4sIII6Q"), 2: struct.Struct("<4sIII7Q"), 3: struct.Struct("<4sIII9Q"),
+            4: struct.Struct("<4sIII8Q")}
+_HEADER = _HEADERS[VERSION]
+
+def _decode_varint(buf, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+def _offsets(typecode: str, values: list[int]) -> bytes:
+    arr = array(typecode, values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+def _pad(out: bytearray):
+    out.extend(b"\0" * (-len(out) % 8))
+
+def write_binary_index(index: Mapping[str, dict[str, int]], out_path: str):
+    docs = sorted({d for postings in index.values() for d in postings})
+    doc_ids = {d: i for i, d in enumerate(docs)}
+    terms = sorted(t for t in index if index[t])
+
+    doc_blob, doc_offs = bytearray(), [0]
+    for d in docs:
+        doc_blob += d.encode("utf-8")
+        doc_offs.append(len(doc_blob))
+
+    term_blob, term_offs = bytearray(), [0]
+    max_counts = []
+    ids, counts, id_offs = [], [], [0]
+    for t in terms:
+        term_blob += t.encode("utf-8")
+        term_offs.append(len(term_blob))
+        postings = sorted((doc_ids[d], c) for d, c in index[t].items())
+        max_counts.append(max(c for _, c in postings))
+        ids.extend(doc_id for doc_id, _ in postings)
+        counts.extend(c for _, c in postings)
+        id_offs.append(len(ids))
+
+    body = bytearray()
+    sections = []
+    for chunk in (_offsets("I", doc_offs), doc_blob, _offsets("I", term_offs), term_blob,
+                  _offsets("I", max_counts), _offsets("Q", id_offs), _offsets("I", ids), _offsets("I", counts)):
+        sections.append(_HEADER.size + len(body))
+        body += chunk
+        _pad(body)
+    with open(out_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(docs), len(terms), *sections))
+        f.write(body)
+
+def convert(text_path: str, out_path: str):
+    write_binary_index(load_index(text_path), out_path)
+
+def is_binary_index(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class BinaryIndex(Mapping):
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from("<4sI", self._mm, 0)
+        if magic != MAGIC or version not in _HEADERS:
+            raise ValueError(f"{path} is not a version {'/'.join(map(str, _HEADERS))} binary index")
+        _, _, self.n_docs, self.n_terms, *sections = _HEADERS[version].unpack_from(self._mm, 0)
+        mv = memoryview(self._mm)
+        self._max_counts = self._id_offs = self._ids = self._counts = None
+        self._post_offs = self._post_blob = None
+        if version == 4:
+            doc_offs, doc_blob, term_offs, term_blob, max_counts, id_offs, ids, counts = sections
+            term_end = max_counts
+        elif version == 3:
+            doc_offs, doc_blob, term_offs, term_blob, post_offs, max_counts, id_offs, ids, post_blob = sections
+        elif version == 2:
+            doc_offs, doc_blob, term_offs, term_blob, post_offs, max_counts, post_blob = sections
+        else:
+            doc_offs, doc_blob, term_offs, term_blob, post_offs, post_blob = sections
+        if version >= 2:
+            self._max_counts = self._array(mv, max_counts, "I", self.n_terms)
+        if version >= 3:
+            self._id_offs = self._array(mv, id_offs, "Q", self.n_terms + 1)
+            self._ids = self._array(mv, ids, "I", self._id_offs[self.n_terms])
+        if version == 4:
+            self._counts = self._array(mv, counts, "I", self._id_offs[self.n_terms])
+        else:
+            term_end = post_offs
+            self._post_offs = self._array(mv, post_offs, "Q", self.n_terms + 1)
+            self._post_blob = mv[post_blob:]
+        self._doc_offs = self._array(mv, doc_offs, "I", self.n_docs + 1)
+        self._doc_blob = mv[doc_blob:term_offs]
+        self._term_offs = self._array(mv, term_offs, "I", self.n_terms + 1)
+        self._term_blob = mv[term_blob:term_end]
+        self._doc_names: list[str | None] = [None] * self.n_docs
+        self.resident_bytes = _HEADERS[version].size
+
+    @staticmethod
+    def _array(mv: memoryview, start: int, typecode: str, n: int):
+        size = array(typecode).itemsize
+        if sys.byteorder != "little":
+            arr = array(typecode, mv[start:start + n * size].tobytes())
+            arr.byteswap()
+            return arr
+        return mv[start:start + n * size].cast(typecode)
+
+    def _term_bytes(self, i: int) -> bytes:
+        return bytes(self._term_blob[self._term_offs[i]:self._term_offs[i + 1]])
+
+    def term_at(self, i: int) -> str:
+        return self._term_bytes(i).decode("utf-8")
+
+    def doc_name(self, doc_id: int) -> str:
+        name = self._doc_names[doc_id]
+        if name is None:
+            name = bytes(self._doc_blob[self._doc_offs[doc_id]:self._doc_offs[doc_id + 1]]).decode("utf-8")
+            self._doc_names[doc_id] = name
+        return name
+
+    def find(self, term: str) -> int:
+        key = term.encode("utf-8")
+        lo = self._lower_bound(key)
+        return lo if lo < self.n_terms and self._term_bytes(lo) == key else -1
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def seek(self, prefix: str) -> int:
+        # Ordinal of the first term >= prefix
+        return self._lower_bound(prefix.encode("utf-8"))
+
+    def terms_with_prefix(self, prefix: str) -> list[str]:
+        # UTF-8 byte order is code point order, so the matches are one contiguous run;
+        # bumping the last byte bounds it (0xff never occurs in UTF-8)
+        key = prefix.encode("utf-8")
+        lo = self._lower_bound(key)
+        hi = self._lower_bound(key[:-1] + bytes([key[-1] + 1])) if key else self.n_terms
+        return [self.term_at(i) for i in range(lo, hi)]
+
+    def postings_at(self, i: int) -> list[tuple[int, int]]:
+        if self._counts is not None:
+            lo, hi = self._id_offs[i], self._id_offs[i + 1]
+            return list(zip(self._ids[lo:hi], self._counts[lo:hi]))
+        buf, pos = self._post_blob, self._post_offs[i]
+        n, pos = _decode_varint(buf, pos)
+        out, doc_id = [], 0
+        for _ in range(n):
+            delta, pos = _decode_varint(buf, pos)
+            cnt, pos = _decode_varint(buf, pos)
+            doc_id += delta
+            out.append((doc_id, cnt))
+        return out
+
+    def max_count(self, term: str) -> int:
+        i = self.find(term)
+        if i < 0:
+            return 0
+        if self._max_counts is None:
+            return max(c for _, c in self.postings_at(i))
+        return self._max_counts[i]
+
+    def doc_ids(self, term: str) -> Sequence[int]:
+        # Sorted doc ids; a zero-copy slice of the mmap from version 3 on
+        i = self.find(term)
+        if i < 0:
+            return array("I")
+        if self._ids is None:
+            return array("I", (d for d, _ in self.postings_at(i)))
+        return self._ids[self._id_offs[i]:self._id_offs[i + 1]]
+
+    def doc_counts(self, term: str) -> Sequence[int]:
+        # Counts aligned with doc_ids(term); a zero-copy slice of the mmap from version 4 on
+        i = self.find(term)
+        if i < 0:
+            return array("I")
+        if self._counts is None:
+            return array("I", (c for _, c in self.postings_at(i)))
+        return self._counts[self._id_offs[i]:self._id_offs[i + 1]]
+
+    def __getitem__(self, term: str) -> dict[str, int]:
+        i = self.find(term)
+        if i < 0:
+            raise KeyError(term)
+        return {self.doc_name(d): c for d, c in self.postings_at(i)}
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and self.find(term) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.term_at(i) for i in range(self.n_terms))
+
+    def __len__(self) -> int:
+        return self.n_terms
+
+    def iter_lines(self, start: int = 0, stop: int | None = None) -> Iterator[str]:
+        for i in range(start, self.n_terms if stop is None else min(stop, self.n_terms)):
+            postings = "\t".join(f"{self.doc_name(d)}:{c}" for d, c in self.postings_at(i))
+            yield f"{self.term_at(i)}\t{postings}\n"
+
+    def close(self):
+        for name in ("_doc_offs", "_doc_blob", "_term_offs", "_term_blob", "_post_offs", "_max_counts",
+                     "_id_offs", "_ids", "_counts", "_post_blob"):
+            view = getattr(self, name)
+            if isinstance(view, memoryview):
+                view.release()
+        self._mm.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(f"Usage: {sys.argv[0]} <text_index> <output{BINARY_SUFFIX}>", file=sys.stderr)
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
@@ -1,8 +1,15 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+local_mode=0
+if [ "${1:-}" = "--local" ]; then
+  local_mode=1
+  shift
+fi
+
 if [ "$#" -lt 4 ]; then
-  echo "Usage: $0 <input_files...> <output_file> <num_reducers> <variant>" >&2
+  echo "Usage: $0 [--local] <input_files...> <output_file> <num_reducers> <variant>" >&2
+  echo "  --local  run in Hadoop's LocalJobRunner on the local filesystem (\$LOCAL_THREADS tasks at once, default: all cores) instead of HDFS/YARN" >&2
   exit 1
 fi
 
@@ -17,22 +24,67 @@ input_files=("${args[@]:0:$((argc-3))}")   # all but the last 3
 stage="/tmp/hadoop_input_$$"
 rm -rf "$stage"
 mkdir  -p "$stage"
-for f in "${input_files[@]}"; do
-  cp "$f" "$stage/"
-done
 
-hdfs dfs -rm -r -f /input /output  || true
-hdfs dfs -mkdir /input
-hdfs dfs -put   "$stage"/*  /input
+if [ "$local_mode" -eq 1 ]; then
+  # Hard links stand in for copies where the filesystem allows
+  for f in "${input_files[@]}"; do
+    ln -f "$f" "$stage/" 2>/dev/null || cp "$f" "$stage/"
+  done
+
+  # The driver reads a plain Configuration, so local mode comes from a config dir of its own:
+  # the cluster's settings with the default filesystem and the framework switched to local
+  conf="$stage.conf"
+  job_out="$stage.out"
+  threads="${LOCAL_THREADS:-$(nproc)}"
+  mkdir -p "$conf"
+  cluster_conf="${HADOOP_CONF_DIR:-${HADOOP_HOME:-/nonexistent}/etc/hadoop}"
+  if [ -d "$cluster_conf" ]; then
+    cp -r "$cluster_conf"/. "$conf"/
+  fi
+  cat > "$conf/core-site.xml" <<EOF
+<?xml version="1.0"?>
+<configuration>
+  <property><name>fs.defaultFS</name><value>file:///</value></property>
+  <property><name>hadoop.tmp.dir</name><value>$stage.tmp</value></property>
+</configuration>
+EOF
+  cat > "$conf/mapred-site.xml" <<EOF
+<?xml version="1.0"?>
+<configuration>
+  <property><name>mapreduce.framework.name</name><value>local</value></property>
+  <property><name>mapreduce.local.map.tasks.maximum</name><value>$threads</value></property>
+  <property><name>mapreduce.local.reduce.tasks.maximum</name><value>$threads</value></property>
+</configuration>
+EOF
+
+  echo "Running Hadoop job locally   reducers=$num_reducers   variant=$variant   threads=$threads"
+  hadoop --config "$conf" jar invindex.jar "$stage" "$num_reducers" "$job_out" "$variant"
+else
+  for f in "${input_files[@]}"; do
+    cp "$f" "$stage/"
+  done
 
-echo "Running Hadoop job   reducers=$num_reducers   variant=$variant"
-hadoop jar invindex.jar /input "$num_reducers" /output "$variant"
+  hdfs dfs -rm -r -f /input /output  || true
+  hdfs dfs -mkdir /input
+  hdfs dfs -put   "$stage"/*  /input
+
+  echo "Running Hadoop job   reducers=$num_reducers   variant=$variant"
+  hadoop jar invindex.jar /input "$num_reducers" /output "$variant"
+fi
 
 mkdir -p "$(dirname "$output_file")"
 tmp_out=$(mktemp "/tmp/invindex_merge_XXXXXX")   # tmp outside output/
 echo "Saving HDFS /output  ?  $output_file"
-hdfs dfs -getmerge /output "$tmp_out"
+if [ "$local_mode" -eq 1 ]; then
+  # Part files concatenated in name order, as getmerge does
+  cat "$job_out"/part-* > "$tmp_out"
+else
+  hdfs dfs -getmerge /output "$tmp_out"
+fi
 mv -f "$tmp_out" "$output_file"
+python3 index_meta.py "$output_file" --normalization none
+python3 index_stats.py "$output_file"
+python3 index_segments.py init "$output_file" "${input_files[@]}"
 
 echo "Output saved to $output_file"
-rm -rf "$stage"
+rm -rf "$stage" "$stage.conf" "$stage.out" "$stage.tmp"
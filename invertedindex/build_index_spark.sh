@@ -1,8 +1,24 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+job_opts=()
+positions=0
+local_mode=0
+while [ "$#" -gt 0 ]; do
+  case "$1" in
+    --positions) positions=1; job_opts+=(--positions); shift ;;
+    --aggregation) job_opts+=(--aggregation "$2"); shift 2 ;;
+    --engine) job_opts+=(--engine "$2"); shift 2 ;;
+    --input-mode) job_opts+=(--input-mode "$2"); shift 2 ;;
+    --local) local_mode=1; shift ;;
+    --*) echo "Unknown option: $1" >&2; exit 1 ;;
+    *) break ;;
+  esac
+done
+
 if [ "$#" -lt 3 ]; then
-  echo "Usage: $0 <input_files...> <output_file> <num_partitions>" >&2
+  echo "Usage: $0 [--local] [--positions] [--aggregation groupbykey|combine] [--engine rdd|dataframe] [--input-mode whole|lines] <input_files...> <output_file> <num_partitions>" >&2
+  echo "  --local  run on this machine with local[\$LOCAL_THREADS] (default: all cores), reading and writing the local filesystem instead of HDFS/YARN" >&2
   exit 1
 fi
 
@@ -13,40 +29,71 @@ out="${args[$((n-2))]}"
 inputs=("${args[@]:0:$((n-2))}")
 
 stage="/tmp/spark_input_$$"
-in_hdfs="/spark_input_$$"
-out_hdfs="/spark_output_$$"
 
 echo "[PREP]"
 rm -rf "$stage"; mkdir -p "$stage"
-cp "${inputs[@]}" "$stage/"
+if [ "$local_mode" -eq 1 ]; then
+  # Nothing leaves this machine: hard links stand in for copies where the filesystem allows
+  for f in "${inputs[@]}"; do ln -f "$f" "$stage/" 2>/dev/null || cp "$f" "$stage/"; done
+  threads="${LOCAL_THREADS:-*}"
+  in_path="file://$stage"
+  out_path="file:///tmp/spark_output_$$"
+  submit_opts=(--master "local[$threads]" --conf spark.pyspark.python="$(command -v python3)")
+else
+  cp "${inputs[@]}" "$stage/"
+  in_path="/spark_input_$$"
+  out_path="/spark_output_$$"
 
-echo "[HDFS]"
-hdfs dfs -rm -r -f "$in_hdfs" "$out_hdfs" || true
-hdfs dfs -mkdir "$in_hdfs"
-hdfs dfs -put "$stage"/* "$in_hdfs"
+  echo "[HDFS]"
+  hdfs dfs -rm -r -f "$in_path" "$out_path" "${out_path}_positions" || true
+  hdfs dfs -mkdir "$in_path"
+  hdfs dfs -put "$stage"/* "$in_path"
+  submit_opts=(
+    --master yarn
+    --deploy-mode cluster
+    --conf spark.yarn.appMasterEnv.PYSPARK_PYTHON="$(command -v python3)"
+    --conf spark.executorEnv.PYSPARK_PYTHON="$(command -v python3)"
+  )
+fi
 
 echo "[PKG]"
-zip -j deps.zip query_index.py
+zip -j deps.zip query_index.py index_meta.py tokenizer.py stem_cache.py
 
 echo "[SPARK]"
 spark-submit \
-  --master yarn \
-  --deploy-mode cluster \
+  "${submit_opts[@]}" \
   --name InvertedIndexSpark \
   --py-files deps.zip \
-  --conf spark.yarn.appMasterEnv.PYSPARK_PYTHON="$(command -v python3)" \
-  --conf spark.executorEnv.PYSPARK_PYTHON="$(command -v python3)" \
   spark/inverted_index_spark.py \
-  "$in_hdfs" "$out_hdfs" "$parts"
+  "$in_path" "$out_path" "$parts" ${job_opts[@]+"${job_opts[@]}"}
 
 echo "[FETCH]"
 mkdir -p "$(dirname "$out")"
-tmp=$(mktemp /tmp/merge_XXXX)
-hdfs dfs -getmerge "$out_hdfs" "$tmp"
-mv -f "$tmp" "$out"
+fetch() {
+  # Part files concatenated in name order, as getmerge does
+  local tmp
+  tmp=$(mktemp /tmp/merge_XXXX)
+  if [ "$local_mode" -eq 1 ]; then
+    cat "${1#file://}"/part-* > "$tmp"
+  else
+    hdfs dfs -getmerge "$1" "$tmp"
+  fi
+  mv -f "$tmp" "$2"
+}
+fetch "$out_path" "$out"
+if [ "$positions" -eq 1 ]; then
+  fetch "${out_path}_positions" "$out.pos"
+fi
+python3 index_meta.py "$out" --normalization query
+python3 index_stats.py "$out"
+python3 index_segments.py init "$out" "${inputs[@]}"
 
 echo "[CLEAN]"
-hdfs dfs -rm -r -f "$in_hdfs" "$out_hdfs"
+if [ "$local_mode" -eq 1 ]; then
+  rm -rf "${out_path#file://}" "${out_path#file://}_positions"
+else
+  hdfs dfs -rm -r -f "$in_path" "$out_path" "${out_path}_positions"
+fi
 rm -rf "$stage" deps.zip
 
 echo "[DONE] ? $out"
@@ -0,0 +1,173 @@
+import itertools
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+# Builds running at once; the rest wait in the queue
+BUILD_CONCURRENCY = int(os.environ.get("BUILD_CONCURRENCY", "2"))
+# Output lines kept per job; older ones are dropped but still counted in offsets
+MAX_LOG_LINES = 20000
+# Finished jobs remembered for the /jobs listing
+MAX_FINISHED_JOBS = 100
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+class Job:
+    def __init__(self, job_id: str, cmd: list[str], output: str | None):
+        self.id, self.cmd, self.output = job_id, cmd, output
+        self.status = QUEUED
+        self.returncode: int | None = None
+        self.submitted_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.proc: subprocess.Popen | None = None
+        self._lines: list[tuple[str, str]] = []
+        self._dropped = 0
+        self._changed = threading.Condition()
+
+    @property
+    def wall_time(self) -> float | None:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def _append(self, stream: str, line: str):
+        with self._changed:
+            self._lines.append((stream, line))
+            excess = len(self._lines) - MAX_LOG_LINES
+            if excess > 0:
+                del self._lines[:excess]
+                self._dropped += excess
+            self._changed.notify_all()
+
+    @property
+    def n_lines(self) -> int:
+        return self._dropped + len(self._lines)
+
+    def _finish(self, status: str, returncode: int | None = None):
+        with self._changed:
+            if self.status not in FINISHED:
+                self.status, self.returncode = status, returncode
+                self.finished_at = time.time()
+            self._changed.notify_all()
+
+    def lines(self, offset: int = 0) -> tuple[list[tuple[str, str]], int]:
+        # Lines from absolute offset on, and the offset to ask for next
+        with self._changed:
+            start = max(offset - self._dropped, 0)
+            return self._lines[start:], self.n_lines
+
+    def follow(self, offset: int = 0, poll: float = 1.0) -> Iterator[tuple[str, str]]:
+        # Yields output as it arrives until the job has finished and everything was sent
+        while True:
+            with self._changed:
+                if offset >= self.n_lines and self.finished_at is None:
+                    self._changed.wait(poll)
+                # Not the status: a cancelled job is still flushing output until its process exits
+                done = self.finished_at is not None
+            lines, offset = self.lines(offset)
+            yield from lines
+            if done and offset >= self.n_lines:
+                return
+
+    def to_dict(self, offset: int | None = None) -> dict:
+        d = {
+            "id": self.id, "cmd": self.cmd, "output": self.output, "status": self.status,
+            "returncode": self.returncode, "submitted_at": self.submitted_at,
+            "started_at": self.started_at, "finished_at": self.finished_at, "wall_time": self.wall_time,
+        }
+        if offset is not None:
+            lines, d["next_offset"] = self.lines(offset)
+            d["lines"] = [{"stream": s, "text": t} for s, t in lines]
+        return d
+
+class JobManager:
+    def __init__(self, max_concurrent: int = BUILD_CONCURRENCY):
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="build")
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, cmd: list[str], output: str | None = None) -> Job:
+        with self._lock:
+            job = Job(str(next(self._ids)), cmd, output)
+            self._jobs[job.id] = job
+            self._forget_finished()
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None:
+            return False
+        with job._changed:
+            # Checked under the job's lock, which _run takes to record the exit status, so a
+            # build that already exited is never relabelled cancelled
+            if job.status in FINISHED or (job.proc is not None and job.proc.poll() is not None):
+                return False
+            proc = job.proc
+            if proc is None:
+                # Still queued: the worker sees this and never starts it
+                job._finish(CANCELLED)
+                return True
+            job.status = CANCELLED
+        # The build scripts start hadoop/spark children; signal the whole process group
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        return True
+
+    def _forget_finished(self):
+        finished = [j.id for j in self._jobs.values() if j.status in FINISHED]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job):
+        with job._changed:
+            if job.status == CANCELLED:
+                return
+            job.status, job.started_at = RUNNING, time.time()
+            try:
+                job.proc = subprocess.Popen(job.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                            text=True, errors="replace", bufsize=1, start_new_session=True)
+            except OSError as e:
+                job._append("stderr", f"{e}\n")
+                job._finish(FAILED)
+                return
+        readers = [threading.Thread(target=self._pump, args=(job, name, stream), daemon=True)
+                   for name, stream in (("stdout", job.proc.stdout), ("stderr", job.proc.stderr))]
+        for r in readers:
+            r.start()
+        returncode = job.proc.wait()
+        # Recorded as soon as the process exits; a cancelled job keeps its status
+        with job._changed:
+            job.returncode = returncode
+            if job.status != CANCELLED:
+                job.status = SUCCEEDED if returncode == 0 else FAILED
+        for r in readers:
+            r.join()
+        # Finished once all output is in, which follow() waits for
+        with job._changed:
+            job.finished_at = time.time()
+            job._changed.notify_all()
+
+    @staticmethod
+    def _pump(job: Job, name: str, stream):
+        with stream:
+            for line in stream:
+                job._append(name, line)
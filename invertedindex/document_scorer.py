@@ -1,38 +1,285 @@
+import heapq
+import math
 import os
-from collections import defaultdict
-from query_index import stem, load_index, STOP_WORDS
+from collections import Counter, defaultdict
+from itertools import accumulate
+from typing import Callable, Container, Sequence
+from query_index import gallop, stem, load_positions, STOP_WORDS, POSITIONS_SUFFIX
+from index_cache import get_index
+from index_stats import doc_stats
+from index_segments import has_segments, segment_positions
 
 PARTIAL_MATCH_BONUS = 5
 EXACT_PHRASE_BONUS = 10
 DATASETS_DIR = "datasets"
 
-def score_documents(index_path: str, query_terms: list[str]) -> tuple[dict[str, int], list[str]]:
-    index = load_index(index_path)
+def _follows(starts: list[int], positions: list[int], offset: int) -> list[int]:
+    # Starts p (sorted) for which p + offset occurs in positions (sorted)
+    out, i, j = [], 0, 0
+    while i < len(starts) and j < len(positions):
+        target = starts[i] + offset
+        if target == positions[j]:
+            out.append(starts[i])
+            i += 1
+            j += 1
+        elif target < positions[j]:
+            i += 1
+        else:
+            j += 1
+    return out
 
+def phrase_in_doc(positions: dict[str, dict[str, list[int]]], phrase: list[tuple[int, str]], doc: str) -> bool:
+    lists = [(off, positions.get(s, {}).get(doc)) for off, s in phrase]
+    if not lists or not all(ps for _, ps in lists):
+        return False
+    first_off, starts = lists[0]
+    for off, ps in lists[1:]:
+        starts = _follows(starts, ps, off - first_off)
+        if not starts:
+            return False
+    return True
+
+def _query_stems(query_terms: list[str]) -> list[str]:
     # Filter stop-words once, then stem
-    stems = [stem(t) for t in query_terms if t.lower() not in STOP_WORDS and stem(t)]
+    return [stem(t) for t in query_terms if t.lower() not in STOP_WORDS and stem(t)]
+
+def phrase_matcher(index_path: str, query_terms: list[str]) -> Callable[[str], bool]:
+    pos_path = index_path + POSITIONS_SUFFIX
+    if os.path.exists(pos_path):
+        if has_segments(index_path):
+            positions = get_index(index_path, segment_positions)
+        else:
+            positions = get_index(pos_path, load_positions)
+        # Query offsets keep stop-words in the count, matching the builders' token positions
+        phrase = [(i, stem(t)) for i, t in enumerate(query_terms) if stem(t)]
+        return lambda doc: phrase_in_doc(positions, phrase, doc)
+
     literal_phrase = " ".join(query_terms).lower()
+    def literal_in_doc(doc: str) -> bool:
+        try:
+            with open(os.path.join(DATASETS_DIR, doc), encoding="utf-8") as f:
+                return literal_phrase in f.read().lower()
+        except FileNotFoundError:
+            return False
+    return literal_in_doc
+
+class CountScorer:
+    # The original ranking: raw counts plus fixed bonuses, no statistics needed.
+    # Scorers work on doc ids and document frequencies, so ranking never maps ids to names.
+    partial_bonus = PARTIAL_MATCH_BONUS
+    phrase_bonus = EXACT_PHRASE_BONUS
+
+    def __init__(self, index_path: str, index):
+        self.index = index
+
+    def term_scorer(self, term: str, df: int) -> Callable[[int, int], float]:
+        return lambda doc_id, cnt: cnt
+
+    def upper_bound(self, term: str, df: int) -> float:
+        return self.index.max_count(term)
+
+class BM25Scorer:
+    partial_bonus = 0
+    phrase_bonus = 0
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, index_path: str, index):
+        self.index = index
+        self.stats = doc_stats(index_path)
+        self.norms = self.stats.bm25_norms_by_id(self.k1, self.b, index)
+
+    def idf(self, df: int) -> float:
+        n = max(self.stats.n_docs, df)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def term_scorer(self, term: str, df: int) -> Callable[[int, int], float]:
+        idf, k1, norms = self.idf(df), self.k1, self.norms
+        return lambda doc_id, cnt: idf * cnt * (k1 + 1) / (cnt + norms[doc_id])
+
+    def upper_bound(self, term: str, df: int) -> float:
+        # Saturation is steepest for an empty doc: norm >= k1 * (1 - b)
+        mc = self.index.max_count(term)
+        return self.idf(df) * mc * (self.k1 + 1) / (mc + self.k1 * (1 - self.b)) if mc else 0.0
+
+class TfIdfScorer:
+    # Sublinear tf: (1 + log tf) * log(1 + N / df)
+    partial_bonus = 0
+    phrase_bonus = 0
+
+    def __init__(self, index_path: str, index):
+        self.index = index
+        self.stats = doc_stats(index_path)
+
+    def idf(self, df: int) -> float:
+        return math.log(1 + self.stats.n_docs / df) if df else 0.0
+
+    def term_scorer(self, term: str, df: int) -> Callable[[int, int], float]:
+        idf = self.idf(df)
+        return lambda doc_id, cnt: (1 + math.log(cnt)) * idf
+
+    def upper_bound(self, term: str, df: int) -> float:
+        mc = self.index.max_count(term)
+        return (1 + math.log(mc)) * self.idf(df) if mc else 0.0
 
-    scores: dict[str, int] = defaultdict(int)
-    for s in stems:
-        for doc, cnt in index.get(s, {}).items():
-            scores[doc] += cnt
+SCORERS = {"counts": CountScorer, "bm25": BM25Scorer, "tfidf": TfIdfScorer}
+DEFAULT_SCORER = "counts"
+
+def make_scorer(name: str, index_path: str, index):
+    if name not in SCORERS:
+        raise ValueError(f"Unknown scorer {name!r}, expected one of: {', '.join(SCORERS)}")
+    return SCORERS[name](index_path, index)
+
+def score_documents(index_path: str, query_terms: list[str],
+                    scorer: str = DEFAULT_SCORER) -> tuple[dict[str, float], list[str]]:
+    index = get_index(index_path)
+    weights = Counter(_query_stems(query_terms))
+    postings = {s: dict(zip(index.doc_ids(s), index.doc_counts(s))) for s in weights}
+    sc = make_scorer(scorer, index_path, index)
+    in_phrase = phrase_matcher(index_path, query_terms)
+
+    scores: dict[int, float] = defaultdict(int)
+    for s, w in weights.items():
+        term_score = sc.term_scorer(s, len(postings[s]))
+        for doc_id, cnt in postings[s].items():
+            scores[doc_id] += w * term_score(doc_id, cnt)
 
     if not scores:
         return {}, []
 
+    named: dict[str, float] = {}
     exact_phrase_docs: list[str] = []
-    for doc in list(scores):
+    for doc_id, score in scores.items():
+        doc = index.doc_name(doc_id)
         # Bonus when all stems are present
-        if all(doc in index.get(s, {}) for s in stems):
-            scores[doc] += PARTIAL_MATCH_BONUS
+        if all(doc_id in p for p in postings.values()):
+            score += sc.partial_bonus
+        if in_phrase(doc):
+            score += sc.phrase_bonus
+            exact_phrase_docs.append(doc)
+        named[doc] = score
 
-        try:
-            with open(os.path.join(DATASETS_DIR, doc), encoding="utf-8") as f:
-                if literal_phrase in f.read().lower():
-                    scores[doc] += EXACT_PHRASE_BONUS
-                    exact_phrase_docs.append(doc)
-        except FileNotFoundError:
-            pass
+    return named, exact_phrase_docs
+
+class _Ranked:
+    # Heap entry: the heap root is the entry top-k would drop first (lowest score, then last
+    # doc). Doc ids follow sorted doc names in every index format, so ids break ties by name.
+    __slots__ = ("score", "doc_id")
+
+    def __init__(self, score: float, doc_id: int):
+        self.score, self.doc_id = score, doc_id
+
+    def __lt__(self, other: "_Ranked") -> bool:
+        return (self.score, other.doc_id) < (other.score, self.doc_id)
+
+# Past every doc id (ids are u32)
+_END = 1 << 32
+
+class _Cursor:
+    # One query term's sorted doc ids and the counts aligned with them, read forward only;
+    # doc is the id under the cursor
+    __slots__ = ("ids", "counts", "n", "pos", "doc", "slot", "weight", "score", "bound")
+
+    def __init__(self, ids: Sequence[int], counts: Sequence[int], slot: int, weight: int,
+                 score: Callable[[int, int], float], bound: float):
+        self.ids, self.counts, self.n, self.pos = ids, counts, len(ids), 0
+        self.doc = ids[0] if self.n else _END
+        self.slot, self.weight, self.score, self.bound = slot, weight, score, bound
+
+    def advance(self):
+        self.pos += 1
+        self.doc = self.ids[self.pos] if self.pos < self.n else _END
+
+    def next_geq(self, doc_id: int) -> int:
+        if self.doc < doc_id:
+            self.pos = gallop(self.ids, doc_id, self.pos)
+            self.doc = self.ids[self.pos] if self.pos < self.n else _END
+        return self.doc
+
+    def contribution(self) -> float:
+        return self.weight * self.score(self.doc, self.counts[self.pos])
+
+def top_k_documents(index_path: str, query_terms: list[str], k: int = 5, scorer: str = DEFAULT_SCORER,
+                    stems: list[str] | None = None,
+                    allowed: Container[int] | None = None) -> list[tuple[str, float]]:
+    """The k best (doc, score) pairs of score_documents, ties broken by doc name.
+
+    stems, if given, are index terms to rank on instead of the stemmed query_terms
+    (which then only feed the phrase check); allowed restricts the candidate doc ids.
+
+    Document-at-a-time MaxScore over each term's sorted doc ids and aligned counts
+    (zero-copy slices of a v4 binary index). Terms are ordered by their upper bound
+    (weight * the scorer's bound from the term's max count); once the k-th best score
+    reaches the summed bounds of the lowest ones, docs found only in those lists cannot
+    enter the top k, so those terms stop proposing candidates. The remaining essential
+    lists drive the walk; a candidate looks the others up by galloping forward, and only
+    while its score could still reach the top k. Postings passed over are never read.
+    Doc ids follow sorted doc names in every index format, so the walk visits docs in
+    name order and a later doc never wins a tie; names are only looked up for the
+    phrase check, the expensive part, and the k results.
+    """
+    index = get_index(index_path)
+    weights = Counter(_query_stems(query_terms) if stems is None else stems)
+    if k <= 0 or not weights:
+        return []
+    sc = make_scorer(scorer, index_path, index)
+    phrase_bonus = sc.phrase_bonus if query_terms else 0
+    in_phrase = phrase_matcher(index_path, query_terms) if phrase_bonus else None
+    # The most either bonus can add to a doc's term scores
+    bonus = sc.partial_bonus + phrase_bonus
+
+    cursors = []
+    for slot, (s, w) in enumerate(weights.items()):
+        ids = index.doc_ids(s)
+        cursors.append(_Cursor(ids, index.doc_counts(s), slot, w, sc.term_scorer(s, len(ids)),
+                               w * sc.upper_bound(s, len(ids))))
+    cursors.sort(key=lambda c: c.bound)
+    # below[j]: the summed bounds of cursors[:j]
+    below = list(accumulate((c.bound for c in cursors), initial=0))
+    n_lazy = 0  # cursors[:n_lazy] are non-essential: only looked up, never walked
+
+    heap: list[_Ranked] = []
+    essential = cursors
+    n_terms = len(cursors)
+    doc = min(c.doc for c in essential)
+    while doc < _END:
+        if allowed is None or doc in allowed:
+            # Summed in query-term order whatever the walk order, so equal docs score equal
+            parts = [0] * n_terms
+            score, hits = 0, 0
+            for c in essential:
+                if c.doc == doc:
+                    parts[c.slot] = part = c.contribution()
+                    score += part
+                    hits += 1
+            for j in range(n_lazy - 1, -1, -1):
+                if len(heap) == k and score + below[j + 1] + bonus <= heap[0].score:
+                    break
+                c = cursors[j]
+                if c.next_geq(doc) == doc:
+                    parts[c.slot] = part = c.contribution()
+                    score += part
+                    hits += 1
+            else:
+                score = sum(parts) if n_terms > 1 else score
+                if hits == n_terms:
+                    score += sc.partial_bonus
+                if (phrase_bonus and (len(heap) < k or score + phrase_bonus > heap[0].score)
+                        and in_phrase(index.doc_name(doc))):
+                    score += phrase_bonus
+                if len(heap) < k:
+                    heapq.heappush(heap, _Ranked(score, doc))
+                elif score > heap[0].score:
+                    heapq.heapreplace(heap, _Ranked(score, doc))
+                if len(heap) == k and below[n_lazy + 1] + bonus <= heap[0].score:
+                    while n_lazy < n_terms and below[n_lazy + 1] + bonus <= heap[0].score:
+                        n_lazy += 1
+                    if n_lazy == n_terms:
+                        break
+                    essential = cursors[n_lazy:]
+        for c in essential:
+            if c.doc == doc:
+                c.advance()
+        doc = min(c.doc for c in essential) if len(essential) > 1 else essential[0].doc
 
-    return dict(scores), exact_phrase_docs
+    return [(index.doc_name(r.doc_id), r.score) for r in sorted(heap, reverse=True)]
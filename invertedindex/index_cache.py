@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+from query_index import load_index, COMPRESSED_SUFFIXES
+from binary_index import BinaryIndex, is_binary_index
+from index_segments import SegmentedIndex, has_segments, MANIFEST_SUFFIX
+
+# Budget for all resident indexes; cost is estimated from the on-disk size since
+# a parsed dict of str->dict[str,int] weighs several times the text it came from.
+INDEX_CACHE_BUDGET_MB = int(os.environ.get("INDEX_CACHE_BUDGET_MB", "2048"))
+IN_MEMORY_FACTOR = 6
+COMPRESSION_RATIO = 5
+
+def open_index(path: str) -> Any:
+    if has_segments(path):
+        return SegmentedIndex(path)
+    return BinaryIndex(path) if is_binary_index(path) else load_index(path)
+
+def _signature(path: str) -> tuple:
+    # Incremental updates only rewrite the manifest, so it is part of the index's identity
+    st = os.stat(path)
+    try:
+        m = os.stat(path + MANIFEST_SUFFIX)
+    except FileNotFoundError:
+        return (st.st_mtime_ns, st.st_size)
+    return (st.st_mtime_ns, st.st_size, m.st_mtime_ns, m.st_size)
+
+class IndexCache:
+    def __init__(self, budget_bytes: int, factor: int = IN_MEMORY_FACTOR):
+        self.budget_bytes = budget_bytes
+        self.factor = factor
+        self._entries: OrderedDict = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+        # One lock per key being loaded: concurrent requests for it wait for a single load,
+        # while hits on other entries never wait behind a slow load
+        self._loading: dict = {}
+
+    def _lookup(self, key, signature) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            self._entries.move_to_end(key)
+            return entry
+        return None
+
+    def get(self, path: str, loader: Callable[[str], Any] = open_index) -> Any:
+        key = (os.path.abspath(path), loader)
+        signature = _signature(path)
+        with self._lock:
+            entry = self._lookup(key, signature)
+            if entry is not None:
+                return entry[1]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        with load_lock:
+            try:
+                with self._lock:
+                    entry = self._lookup(key, signature)
+                    if entry is not None:
+                        return entry[1]
+                value = loader(path)
+                # mmap-backed indexes only keep their header resident
+                text_size = signature[1] * (COMPRESSION_RATIO if path.endswith(COMPRESSED_SUFFIXES) else 1)
+                cost = getattr(value, "resident_bytes", text_size * self.factor)
+                with self._lock:
+                    if key in self._entries:
+                        self._drop(key)
+                    self._entries[key] = (signature, value, cost)
+                    self._used += cost
+                    # Never evict the entry we just loaded, even if it alone is over budget
+                    while self._used > self.budget_bytes and len(self._entries) > 1:
+                        self._drop(next(iter(self._entries)))
+                return value
+            finally:
+                # Also when the loader raised; a later request may have set up a newer lock
+                with self._lock:
+                    if self._loading.get(key) is load_lock:
+                        del self._loading[key]
+
+    def invalidate(self, path: str | None = None):
+        with self._lock:
+            for key in list(self._entries):
+                if path is None or key[0] == os.path.abspath(path):
+                    self._drop(key)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "used_bytes": self._used, "budget_bytes": self.budget_bytes}
+
+    def _drop(self, key):
+        _, _, cost = self._entries.pop(key)
+        self._used -= cost
+
+_cache = IndexCache(INDEX_CACHE_BUDGET_MB * 1024 * 1024)
+
+def get_index(path: str, loader: Callable[[str], Any] = open_index) -> Any:
+    return _cache.get(path, loader)
+
+def invalidate(path: str | None = None):
+    _cache.invalidate(path)
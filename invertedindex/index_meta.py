@@ -0,0 +1,37 @@
+import argparse
+import json
+import os
+
+# Sidecar next to an index file recording how it was built
+META_SUFFIX = ".meta.json"
+
+def meta_path(index_path: str) -> str:
+    return index_path + META_SUFFIX
+
+def read_meta(index_path: str) -> dict:
+    try:
+        with open(meta_path(index_path), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_meta(index_path: str, **fields):
+    meta = read_meta(index_path)
+    meta.update(fields)
+    tmp = meta_path(index_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    os.replace(tmp, meta_path(index_path))
+
+def main():
+    from query_index import NORMALIZATION
+    normalizations = {"query": NORMALIZATION, "none": {"stemmer": None, "stop_words": None}}
+    parser = argparse.ArgumentParser(description="Record index build metadata in its sidecar file")
+    parser.add_argument("index_file")
+    parser.add_argument("--normalization", choices=sorted(normalizations), required=True,
+                        help="'query' if terms went through query_index.stem, 'none' if they are raw tokens")
+    args = parser.parse_args()
+    write_meta(args.index_file, normalization=normalizations[args.normalization])
+
+if __name__ == "__main__":
+    main()
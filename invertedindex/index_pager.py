@@ -0,0 +1,211 @@
+import heapq
+import os
+import tempfile
+from bisect import bisect_left
+from operator import itemgetter
+from typing import Iterable, Iterator
+from query_index import open_binary
+
+# One sparse entry per this many bytes of index text: seeking bisects the entries,
+# then scans at most one stride of lines
+OFFSET_INDEX_STRIDE = 64 * 1024
+# Index text that is not one sorted run is sorted once into this sidecar: chunks of at most
+# SORT_CHUNK_BYTES are sorted in memory, then merged at most SORT_FANIN at a time
+SORTED_SUFFIX = ".sorted"
+SORT_CHUNK_BYTES = 64 * 1024 * 1024
+SORT_FANIN = 128
+PAGE_BYTES = 256 * 1024
+PAGE_TERMS = 2000
+
+class _Cursor:
+    # Position-tracking reader; streams that cannot seek (zstd) move forward by reading
+    def __init__(self, f):
+        self.f, self.pos = f, 0
+
+    def seek(self, pos: int):
+        if self.f.seekable():
+            self.pos = self.f.seek(pos)
+            return
+        if pos < self.pos:
+            raise ValueError("cannot seek backwards in this stream")
+        while self.pos < pos:
+            chunk = self.f.read(min(pos - self.pos, 1 << 20))
+            if not chunk:
+                break
+            self.pos += len(chunk)
+
+    def readline(self) -> bytes:
+        line = self.f.readline()
+        self.pos += len(line)
+        return line
+
+    def read(self, n: int) -> bytes:
+        data = self.f.read(n)
+        self.pos += len(data)
+        return data
+
+def _term(line: bytes) -> bytes | None:
+    parts = line.split(None, 1)
+    return parts[0] if parts else None
+
+class OffsetIndex:
+    """Sparse (term, byte offset) samples, one per OFFSET_INDEX_STRIDE, of a sorted index text.
+
+    path is the text that pages and seeks read: the index itself when it is one sorted run
+    (non-parallel output, a single reducer), otherwise its SORTED_SUFFIX sidecar, written
+    once. Hadoop outputs of several reducers are a few concatenated sorted part files, and
+    Spark RDD outputs are hash-partitioned parts in no order; both are viewed through the
+    sidecar. Every seek is then one bisect plus a scan of at most one stride, and memory
+    stays at one sample per stride whatever the number of terms.
+    """
+    def __init__(self, path: str, terms: list[bytes], offsets: list[int], size: int):
+        self.path, self.terms, self.offsets, self.size = path, terms, offsets, size
+        self.resident_bytes = 100 * len(terms) + 1024
+
+class _Sampler:
+    # Collects the samples while lines go by in order
+    def __init__(self):
+        self.terms: list[bytes] = []
+        self.offsets: list[int] = []
+        self.pos = self.next_mark = 0
+
+    def add(self, term: bytes, line: bytes):
+        if self.pos >= self.next_mark:
+            self.terms.append(term)
+            self.offsets.append(self.pos)
+            self.next_mark = self.pos + OFFSET_INDEX_STRIDE
+        self.pos += len(line)
+
+    def index(self, path: str) -> OffsetIndex:
+        return OffsetIndex(path, self.terms, self.offsets, self.pos)
+
+def sorted_path(path: str) -> str:
+    return path + SORTED_SUFFIX
+
+def _keyed_lines(lines: Iterable[bytes]) -> Iterator[tuple[bytes, bytes]]:
+    for line in lines:
+        term = _term(line)
+        if term is not None:
+            yield term, line if line.endswith(b"\n") else line + b"\n"
+
+def _write_run(items: Iterable[tuple[bytes, bytes]], run_path: str, sampler: _Sampler | None = None):
+    with open(run_path, "wb") as out:
+        for term, line in items:
+            out.write(line)
+            if sampler is not None:
+                sampler.add(term, line)
+
+def _read_run(run_path: str) -> Iterator[tuple[bytes, bytes]]:
+    with open(run_path, "rb") as f:
+        yield from _keyed_lines(f)
+
+def sort_index_text(path: str, out_path: str) -> OffsetIndex:
+    """External merge sort of an index text by term into out_path, sampled as it is written.
+
+    Memory is bounded by SORT_CHUNK_BYTES; the runs go to a temporary directory next to
+    out_path, which is replaced atomically.
+    """
+    with tempfile.TemporaryDirectory(prefix=".sort_", dir=os.path.dirname(os.path.abspath(out_path))) as tmp:
+        runs = []
+        with open_binary(path) as f:
+            while chunk := f.readlines(SORT_CHUNK_BYTES):
+                runs.append(os.path.join(tmp, f"run{len(runs):05d}"))
+                _write_run(sorted(_keyed_lines(chunk), key=itemgetter(0)), runs[-1])
+        # Stable sorts and merges of consecutive groups: lines of equal terms keep their file order
+        while len(runs) > SORT_FANIN:
+            merged = []
+            for i in range(0, len(runs), SORT_FANIN):
+                merged.append(os.path.join(tmp, f"pass{len(merged):05d}_{len(runs)}"))
+                _write_run(heapq.merge(*map(_read_run, runs[i:i + SORT_FANIN]), key=itemgetter(0)), merged[-1])
+            runs = merged
+        sampler = _Sampler()
+        tmp_out = os.path.join(tmp, "sorted")
+        _write_run(heapq.merge(*map(_read_run, runs), key=itemgetter(0)), tmp_out, sampler)
+        os.replace(tmp_out, out_path)
+    return sampler.index(out_path)
+
+def _sample(path: str) -> OffsetIndex | None:
+    # Samples of path if it is one sorted run, None at the first term out of order
+    sampler, prev = _Sampler(), None
+    with open_binary(path) as f:
+        for line in f:
+            term = _term(line)
+            if term is not None:
+                if prev is not None and term < prev:
+                    return None
+                prev = term
+                sampler.add(term, line)
+            else:
+                sampler.pos += len(line)
+    return sampler.index(path)
+
+def build_offset_index(path: str) -> OffsetIndex:
+    sidecar = sorted_path(path)
+    if os.path.exists(sidecar) and os.stat(sidecar).st_mtime_ns >= os.stat(path).st_mtime_ns:
+        return _sample(sidecar)
+    offsets = _sample(path)
+    if offsets is not None:
+        return offsets
+    return sort_index_text(path, sidecar)
+
+def _scan(f: _Cursor, start: int, end: int, key: bytes) -> tuple[int, bytes | None]:
+    # First line in [start, end) whose term is >= key, as (offset, term)
+    f.seek(start)
+    while f.pos < end:
+        pos = f.pos
+        line = f.readline()
+        if not line:
+            break
+        term = _term(line)
+        if term is not None and term >= key:
+            return pos, term
+    return end, None
+
+def seek_text(offsets: OffsetIndex, prefix: str) -> int:
+    # Offset in offsets.path of the line where prefix sorts; the end of the text if nothing follows it
+    key = prefix.encode("utf-8")
+    i = max(bisect_left(offsets.terms, key) - 1, 0)
+    start = offsets.offsets[i] if offsets.offsets else 0
+    with open_binary(offsets.path) as raw:
+        return _scan(_Cursor(raw), start, offsets.size, key)[0]
+
+class TextPage:
+    """Lines of an index text file from a byte offset, up to about max_bytes.
+
+    Iterating streams the lines; afterwards next_offset and at_end say where the
+    following page starts. Offsets inside a line move to the next line start.
+    """
+    def __init__(self, path: str, offset: int = 0, max_bytes: int = PAGE_BYTES):
+        self.path, self.offset, self.max_bytes = path, max(offset, 0), max_bytes
+        self.next_offset = self.offset
+        self.at_end = False
+
+    def __iter__(self) -> Iterator[str]:
+        with open_binary(self.path) as raw:
+            f = _Cursor(raw)
+            if self.offset:
+                f.seek(self.offset - 1)
+                if f.read(1) != b"\n":
+                    f.readline()
+            self.next_offset = f.pos
+            sent = 0
+            while sent < self.max_bytes:
+                line = f.readline()
+                if not line:
+                    self.at_end = True
+                    break
+                sent += len(line)
+                self.next_offset = f.pos
+                yield line.decode("utf-8", errors="replace")
+            else:
+                self.at_end = not f.read(1)
+
+class BinaryPage:
+    # Terms of a binary index from an ordinal on; next_offset is the next ordinal
+    def __init__(self, index, offset: int = 0, count: int = PAGE_TERMS):
+        self.index, self.offset = index, max(offset, 0)
+        self.next_offset = min(self.offset + count, index.n_terms)
+        self.at_end = self.next_offset >= index.n_terms
+
+    def __iter__(self) -> Iterator[str]:
+        return self.index.iter_lines(self.offset, self.next_offset)
@@ -0,0 +1,442 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Mapping
+from typing import Iterable, Iterator
+from query_index import load_index, load_positions, stem, NORMALIZATION, POSITIONS_SUFFIX, GZIP_MAGIC, ZSTD_MAGIC
+from binary_index import BinaryIndex, is_binary_index, write_binary_index
+from index_meta import write_meta
+from tokenizer import tokenize_stream
+
+# Incremental updates. Next to an index file live
+#   <index>.manifest.json  every document's source path, mtime, size, sha1 and the segment
+#                          holding its current version (0 is the base index itself)
+#   <index>.segments/      delta segments NNNNNN.txt, text indexes of the docs added or
+#                          changed by one update, with the usual sidecars
+# A document's postings count only from the segment the manifest assigns it, so older
+# versions and deleted files drop out without rewriting anything. Compaction folds the
+# deltas back into the base and removes the segments directory.
+MANIFEST_SUFFIX = ".manifest.json"
+SEGMENTS_SUFFIX = ".segments"
+BASE = 0
+DOC_SUFFIXES = (".txt", ".xml")
+# Compact once there are this many deltas, or once docs changed since the last compaction
+# reach this share of the index
+COMPACT_MAX_SEGMENTS = 8
+COMPACT_DELTA_RATIO = 0.2
+HASH_CHUNK = 1 << 20
+
+def manifest_path(index_path: str) -> str:
+    return index_path + MANIFEST_SUFFIX
+
+def segments_dir(index_path: str) -> str:
+    return index_path + SEGMENTS_SUFFIX
+
+def segment_path(index_path: str, segment: int) -> str:
+    return os.path.join(segments_dir(index_path), f"{segment:06d}.txt")
+
+def has_segments(index_path: str) -> bool:
+    return os.path.isdir(segments_dir(index_path))
+
+def read_manifest(index_path: str) -> dict | None:
+    try:
+        with open(manifest_path(index_path), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_manifest(index_path: str, manifest: dict):
+    tmp = manifest_path(index_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(tmp, manifest_path(index_path))
+
+def _new_manifest() -> dict:
+    return {"docs": {}, "segments": [], "next_segment": 1, "removed": 0}
+
+def _fingerprint(path: str, segment: int, digest: str | None = None, st: os.stat_result | None = None) -> dict:
+    st = st or os.stat(path)
+    return {"path": os.path.abspath(path), "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+            "sha1": digest, "segment": segment}
+
+def _untracked(segment: int) -> dict:
+    # A document whose source file is unknown; it stays until a file of its name is given
+    return {"path": None, "mtime_ns": None, "size": None, "sha1": None, "segment": segment}
+
+def _sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+def find_documents(paths: Iterable[str]) -> dict[str, str]:
+    # doc name -> path; documents are named by file name, as every builder does
+    found = {}
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                for f in sorted(files):
+                    if f.endswith(DOC_SUFFIXES):
+                        found[f] = os.path.join(root, f)
+        elif os.path.isfile(p):
+            found[os.path.basename(p)] = p
+    return found
+
+def init_manifest(index_path: str, paths: Iterable[str], stats: Mapping[str, os.stat_result] | None = None):
+    # Run right after a full build over exactly these files. Hashes are left out and only
+    # computed once a file's mtime or size moves, so this costs one stat per file
+    # (none for paths whose stat result the builder already has in stats).
+    manifest = _new_manifest()
+    stats = stats or {}
+    for name, path in find_documents(paths).items():
+        manifest["docs"][name] = _fingerprint(path, BASE, st=stats.get(path))
+    # Deltas of an index previously written to this path no longer apply
+    shutil.rmtree(segments_dir(index_path), ignore_errors=True)
+    write_manifest(index_path, manifest)
+
+def _open_base(path: str):
+    return BinaryIndex(path) if is_binary_index(path) else load_index(path)
+
+def _doc_names(index) -> list[str]:
+    return [index.doc_name(i) for i in range(index.n_docs)]
+
+class SegmentedIndex(Mapping):
+    """The base index and its delta segments, merged per term on lookup.
+
+    Offers what TextIndex and BinaryIndex do for querying: postings by term, doc ids over
+    a shared doc table, max counts and prefix expansion.
+    """
+    def __init__(self, index_path: str):
+        manifest = read_manifest(index_path) or _new_manifest()
+        self.base = _open_base(index_path)
+        self.segments = [(BASE, self.base)] + [(s, load_index(segment_path(index_path, s)))
+                                                for s in manifest["segments"]]
+        self._live = {d: e["segment"] for d, e in manifest["docs"].items()}
+        docs = set()
+        for segment, index in self.segments:
+            docs.update(d for d in _doc_names(index) if self._live.get(d) == segment)
+        self._doc_names = sorted(docs)
+        self._doc_index = {d: i for i, d in enumerate(self._doc_names)}
+        self._merged: dict[str, dict[str, int]] = {}
+        self._doc_ids: dict[str, array] = {}
+        self._doc_counts: dict[str, array] = {}
+        self._max_counts: dict[str, int] = {}
+        self._all_terms: list[str] | None = None
+        if hasattr(self.base, "resident_bytes"):
+            # mmap-backed base: only the deltas and merged postings take memory
+            self.resident_bytes = self.base.resident_bytes + 100 * len(self._doc_names)
+
+    def _merge(self, term: str) -> dict[str, int]:
+        merged = {}
+        for segment, index in self.segments:
+            postings = index.get(term)
+            if postings:
+                merged.update((d, c) for d, c in postings.items() if self._live.get(d) == segment)
+        return merged
+
+    def __getitem__(self, term: str) -> dict[str, int]:
+        postings = self._merged.get(term)
+        if postings is None:
+            postings = self._merged[term] = self._merge(term)
+        if not postings:
+            raise KeyError(term)
+        return postings
+
+    def _terms(self) -> list[str]:
+        return sorted(set().union(*(iter(index) for _, index in self.segments)))
+
+    def _term_list(self) -> list[str]:
+        if self._all_terms is None:
+            self._all_terms = self._terms()
+        return self._all_terms
+
+    # Paging by term ordinal, as BinaryIndex offers it for the /output viewer. Ordinals run over
+    # every segment's terms; a term left without live documents is skipped, so a page may be short
+    @property
+    def n_terms(self) -> int:
+        return len(self._term_list())
+
+    def seek(self, prefix: str) -> int:
+        return bisect_left(self._term_list(), prefix)
+
+    def iter_lines(self, start: int = 0, stop: int | None = None) -> Iterator[str]:
+        for term in self._term_list()[start:stop]:
+            postings = self._merge(term)
+            if postings:
+                yield f"{term}\t" + "\t".join(f"{d}:{c}" for d, c in sorted(postings.items())) + "\n"
+
+    def iter_merged(self) -> Iterator[tuple[str, dict[str, int]]]:
+        # Every live term in order, without memoizing; for compaction and full scans
+        for term in self._terms():
+            postings = self._merge(term)
+            if postings:
+                yield term, postings
+
+    def __iter__(self) -> Iterator[str]:
+        return (term for term, _ in self.iter_merged())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.iter_merged())
+
+    def doc_ids(self, term: str) -> array:
+        ids = self._doc_ids.get(term)
+        if ids is None:
+            ids = self._doc_ids[term] = array("I", sorted(self._doc_index[d] for d in self.get(term, {})))
+        return ids
+
+    def doc_counts(self, term: str) -> array:
+        counts = self._doc_counts.get(term)
+        if counts is None:
+            postings = self.get(term, {})
+            counts = self._doc_counts[term] = array("I", (postings[self._doc_names[i]] for i in self.doc_ids(term)))
+        return counts
+
+    def terms_with_prefix(self, prefix: str) -> list[str]:
+        terms = set().union(*(index.terms_with_prefix(prefix) for _, index in self.segments))
+        return sorted(t for t in terms if t in self)
+
+    @property
+    def n_docs(self) -> int:
+        return len(self._doc_names)
+
+    def doc_name(self, doc_id: int) -> str:
+        return self._doc_names[doc_id]
+
+    def max_count(self, term: str) -> int:
+        m = self._max_counts.get(term)
+        if m is None:
+            m = self._max_counts[term] = max(self.get(term, {}).values(), default=0)
+        return m
+
+def _segment_files(index_path: str, manifest: dict, suffix: str = "") -> list[tuple[int, str]]:
+    return [(BASE, index_path + suffix)] + [(s, segment_path(index_path, s) + suffix) for s in manifest["segments"]]
+
+def segment_positions(index_path: str) -> dict[str, dict[str, list[int]]]:
+    manifest = read_manifest(index_path) or _new_manifest()
+    live = {d: e["segment"] for d, e in manifest["docs"].items()}
+    merged = defaultdict(dict)
+    for segment, path in _segment_files(index_path, manifest, POSITIONS_SUFFIX):
+        if not os.path.exists(path):
+            continue
+        for term, docs in load_positions(path).items():
+            merged[term].update((d, ps) for d, ps in docs.items() if live.get(d) == segment)
+    return merged
+
+def segment_stats(index_path: str):
+    from index_stats import DocStats, doc_lengths, load_stats, stats_path
+    manifest = read_manifest(index_path) or _new_manifest()
+    live = {d: e["segment"] for d, e in manifest["docs"].items()}
+    lengths = {}
+    for segment, path in _segment_files(index_path, manifest):
+        sp = stats_path(path)
+        seg_lengths = load_stats(sp).doc_lengths if os.path.exists(sp) else doc_lengths(_open_base(path))
+        lengths.update((d, n) for d, n in seg_lengths.items() if live.get(d) == segment)
+    return DocStats(lengths)
+
+def index_document(path: str, with_positions: bool = False) -> tuple[dict[str, int], dict[str, list[int]] | None]:
+    # The query-side normalization (stem() drops stop words), with offsets over all tokens
+    # like the builders' positions
+    positions = defaultdict(list)
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        for i, w in enumerate(tokenize_stream(f)):
+            s = stem(w)
+            if s:
+                positions[s].append(i)
+    counts = {s: len(ps) for s, ps in positions.items()}
+    return counts, (dict(positions) if with_positions else None)
+
+def _open_output(path: str, like: str | None = None):
+    # Same compression as the file it replaces
+    head = b""
+    if like and os.path.exists(like):
+        with open(like, "rb") as f:
+            head = f.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return gzip.open(path, "wt", encoding="utf-8")
+    if head.startswith(ZSTD_MAGIC):
+        import zstandard
+        return zstandard.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def _write_lines(path: str, items: Iterable[tuple[str, dict]], fmt=str, like: str | None = None):
+    with _open_output(path, like) as f:
+        for term, postings in items:
+            f.write(f"{term}\t{' '.join(f'{d}:{fmt(v)}' for d, v in sorted(postings.items()))}\n")
+
+def _join(ps: list[int]) -> str:
+    return ",".join(map(str, ps))
+
+def write_segment(path: str, postings: dict[str, dict[str, int]], doc_lengths: dict[str, int],
+                  positions: dict[str, dict[str, list[int]]] | None = None):
+    from index_stats import write_stats
+    _write_lines(path, sorted(postings.items()))
+    if positions is not None:
+        _write_lines(path + POSITIONS_SUFFIX, sorted(positions.items()), _join)
+    write_meta(path, normalization=NORMALIZATION)
+    write_stats(path, doc_lengths)
+
+def update(index_path: str, paths: Iterable[str] = ()) -> dict:
+    """Index documents that are new or changed since the last update into a delta segment.
+
+    Tracked documents are always rechecked; paths add new files or directories. Without a
+    manifest, every document of the base index is kept: files among paths whose names it
+    already holds are taken as indexed, the others stay as they are with no source to recheck.
+    """
+    manifest = read_manifest(index_path)
+    found = find_documents(paths)
+    created = manifest is None
+    if created:
+        manifest = _new_manifest()
+        for name in _doc_names(_open_base(index_path)):
+            manifest["docs"][name] = _fingerprint(found[name], BASE) if name in found else _untracked(BASE)
+    docs = manifest["docs"]
+    candidates = {name: entry["path"] for name, entry in docs.items()}
+    candidates.update(found)
+
+    changed, removed, touched = {}, [], created
+    for name, path in candidates.items():
+        entry = docs.get(name)
+        if path is None:
+            continue
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if entry is not None:
+                removed.append(name)
+            continue
+        if entry and entry["path"] == os.path.abspath(path) and \
+                (entry["mtime_ns"], entry["size"]) == (st.st_mtime_ns, st.st_size):
+            continue
+        digest = _sha1(path)
+        if entry and entry["sha1"] == digest:
+            # Touched or moved, same content: remember the new stat so it is not hashed again
+            docs[name] = _fingerprint(path, entry["segment"], digest)
+            touched = True
+        else:
+            changed[name] = (path, digest)
+
+    summary = {"added": sum(n not in docs for n in changed), "changed": sum(n in docs for n in changed),
+               "removed": len(removed), "segment": None}
+    if changed or removed:
+        segment = manifest["next_segment"]
+        with_positions = os.path.exists(index_path + POSITIONS_SUFFIX)
+        postings, lengths = defaultdict(dict), {}
+        positions = defaultdict(dict) if with_positions else None
+        for name, (path, digest) in sorted(changed.items()):
+            counts, doc_positions = index_document(path, with_positions)
+            for term, c in counts.items():
+                postings[term][name] = c
+            if counts:
+                lengths[name] = sum(counts.values())
+            if with_positions:
+                for term, ps in doc_positions.items():
+                    positions[term][name] = ps
+            docs[name] = _fingerprint(path, segment, digest)
+        for name in removed:
+            del docs[name]
+        os.makedirs(segments_dir(index_path), exist_ok=True)
+        # The segment is complete before the manifest refers to it
+        write_segment(segment_path(index_path, segment), postings, lengths, positions)
+        manifest["segments"].append(segment)
+        manifest["next_segment"] = segment + 1
+        manifest["removed"] += len(removed)
+        summary["segment"] = segment
+    if changed or removed or touched:
+        write_manifest(index_path, manifest)
+    return summary
+
+def needs_compaction(manifest: dict) -> bool:
+    if not manifest["segments"]:
+        return False
+    churn = sum(e["segment"] != BASE for e in manifest["docs"].values()) + manifest["removed"]
+    return len(manifest["segments"]) >= COMPACT_MAX_SEGMENTS or \
+        churn >= COMPACT_DELTA_RATIO * max(len(manifest["docs"]), 1)
+
+def compact(index_path: str):
+    """Fold the delta segments into a new base index, in the base's own format.
+
+    Readers stay correct throughout: the new base is swapped in first, and until the
+    manifest follows, the docs it took from deltas are still attributed to them.
+    """
+    from index_stats import write_stats
+    manifest = read_manifest(index_path)
+    if manifest is None or not has_segments(index_path):
+        return
+    index = SegmentedIndex(index_path)
+    tmp = index_path + ".compact.tmp"
+    binary = is_binary_index(index_path)
+    if binary:
+        write_binary_index(dict(index.iter_merged()), tmp)
+    else:
+        _write_lines(tmp, index.iter_merged(), like=index_path)
+    pos_path = index_path + POSITIONS_SUFFIX
+    if os.path.exists(pos_path):
+        _write_lines(pos_path + ".tmp", sorted(segment_positions(index_path).items()), _join)
+    lengths = segment_stats(index_path).doc_lengths
+    if binary:
+        index.base.close()
+    os.replace(tmp, index_path)
+    if os.path.exists(pos_path):
+        os.replace(pos_path + ".tmp", pos_path)
+    if not binary:
+        write_meta(index_path, normalization=NORMALIZATION)
+    write_stats(index_path, lengths)
+    for entry in manifest["docs"].values():
+        entry["segment"] = BASE
+    manifest["segments"], manifest["removed"] = [], 0
+    write_manifest(index_path, manifest)
+    shutil.rmtree(segments_dir(index_path), ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental updates: index new or changed documents into delta segments")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("init", help="Record the documents a full build just indexed")
+    p.add_argument("index_file")
+    p.add_argument("paths", nargs="+", help="Files or directories the index was built from")
+    p = sub.add_parser("update", help="Index new, changed and removed documents into a delta segment")
+    p.add_argument("index_file")
+    p.add_argument("paths", nargs="*", help="Files or directories to add; tracked documents are always rechecked")
+    p.add_argument("--compact", choices=["auto", "always", "never"], default="auto",
+                   help=f"Fold deltas into the base afterwards (auto: at {COMPACT_MAX_SEGMENTS} segments "
+                        f"or {COMPACT_DELTA_RATIO:.0%} churn)")
+    p = sub.add_parser("compact", help="Fold the delta segments into the base index")
+    p.add_argument("index_file")
+    p = sub.add_parser("status", help="Show tracked documents and segments")
+    p.add_argument("index_file")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        init_manifest(args.index_file, args.paths)
+    elif args.command == "update":
+        summary = update(args.index_file, args.paths)
+        print(f"{summary['added']} added, {summary['changed']} changed, {summary['removed']} removed"
+              + (f" -> segment {summary['segment']}" if summary["segment"] else ""))
+        manifest = read_manifest(args.index_file)
+        if manifest and (args.compact == "always" or args.compact == "auto" and needs_compaction(manifest)):
+            compact(args.index_file)
+            print("Compacted delta segments into the base index")
+    elif args.command == "compact":
+        compact(args.index_file)
+    else:
+        manifest = read_manifest(args.index_file)
+        if manifest is None:
+            print(f"{args.index_file} has no manifest", file=sys.stderr)
+            sys.exit(1)
+        per_segment = defaultdict(int)
+        for e in manifest["docs"].values():
+            per_segment[e["segment"]] += 1
+        print(f"{len(manifest['docs'])} documents, {manifest['removed']} removed since the last compaction")
+        for s in [BASE] + manifest["segments"]:
+            print(f"  segment {s}: {per_segment[s]} current documents")
+        print(f"Compaction {'due' if needs_compaction(manifest) else 'not due'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import weakref
+from array import array
+from collections import defaultdict
+from typing import Mapping
+from index_cache import get_index, open_index
+from index_segments import has_segments, segment_stats
+
+# Sidecar next to an index file with per-document statistics for BM25/TF-IDF.
+# Document frequencies are not stored: a term's df is the length of its postings.
+STATS_SUFFIX = ".stats.json"
+
+class DocStats:
+    def __init__(self, doc_lengths: dict[str, int]):
+        self.doc_lengths = doc_lengths
+        self.n_docs = len(doc_lengths)
+        self.total_length = sum(doc_lengths.values())
+        self.avg_length = self.total_length / self.n_docs if self.n_docs else 0.0
+        self._norms: dict[tuple[float, float], dict[str, float]] = {}
+        self._id_norms: dict[tuple[float, float], tuple[weakref.ref, array]] = {}
+
+    def bm25_norms(self, k1: float, b: float) -> dict[str, float]:
+        # k1 * (1 - b + b * len / avg) per doc, computed once per (k1, b)
+        norms = self._norms.get((k1, b))
+        if norms is None:
+            avg = self.avg_length or 1.0
+            norms = self._norms[(k1, b)] = {d: k1 * (1 - b + b * n / avg) for d, n in self.doc_lengths.items()}
+        return norms
+
+    def bm25_norms_by_id(self, k1: float, b: float, index) -> array:
+        # The same by the index's doc ids, so scoring never maps ids to names; rebuilt when
+        # the cache hands out a reloaded index
+        cached = self._id_norms.get((k1, b))
+        if cached is None or cached[0]() is not index:
+            norms = self.bm25_norms(k1, b)
+            cached = self._id_norms[(k1, b)] = (
+                weakref.ref(index), array("d", (norms.get(index.doc_name(i), k1) for i in range(index.n_docs))))
+        return cached[1]
+
+def stats_path(index_path: str) -> str:
+    return index_path + STATS_SUFFIX
+
+def doc_lengths(index: Mapping[str, dict[str, int]]) -> dict[str, int]:
+    # A doc's length is its number of indexed tokens, i.e. the sum of its counts
+    lengths: dict[str, int] = defaultdict(int)
+    for term in index:
+        for d, c in index[term].items():
+            lengths[d] += c
+    return dict(lengths)
+
+def write_stats(index_path: str, lengths: dict[str, int]):
+    stats = DocStats(lengths)
+    tmp = stats_path(index_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"n_docs": stats.n_docs, "total_length": stats.total_length,
+                   "avg_doc_length": stats.avg_length, "doc_lengths": lengths}, f, sort_keys=True)
+    os.replace(tmp, stats_path(index_path))
+
+def load_stats(path: str) -> DocStats:
+    with open(path, encoding="utf-8") as f:
+        return DocStats(json.load(f)["doc_lengths"])
+
+def stats_from_index(index_path: str) -> DocStats:
+    return DocStats(doc_lengths(open_index(index_path)))
+
+def doc_stats(index_path: str) -> DocStats:
+    if has_segments(index_path):
+        return get_index(index_path, segment_stats)
+    sp = stats_path(index_path)
+    if os.path.exists(sp):
+        return get_index(sp, load_stats)
+    # Indexes built without the sidecar: derive the lengths from the index itself
+    return get_index(index_path, stats_from_index)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write document statistics for BM25/TF-IDF scoring next to an index")
+    parser.add_argument("index_file")
+    args = parser.parse_args()
+    write_stats(args.index_file, doc_lengths(open_index(args.index_file)))
+
+if __name__ == "__main__":
+    main()
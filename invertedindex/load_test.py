@@ -0,0 +1,149 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Load generator for /api/search: closed-loop clients, each sending one request after another
+DEFAULT_URL = "http://localhost:5000"
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def sample_queries(index_path: str, n: int, seed: int = 0) -> list[str]:
+    # One to three terms, half drawn from the most frequent ones so some queries are expensive
+    from index_cache import get_index
+    index = get_index(index_path)
+    terms = list(index)
+    frequent = sorted(terms, key=lambda t: -len(index[t]))[:200] if len(terms) < 200_000 else terms[:200]
+    rng = random.Random(seed)
+    return [" ".join(rng.sample(frequent if rng.random() < 0.5 else terms, rng.randint(1, min(3, len(terms)))))
+            for _ in range(n)]
+
+def http_client(url: str, index: str, k: int, scorer: str):
+    endpoint = url.rstrip("/") + "/api/search"
+    def send(queries: list[str]):
+        body = json.dumps({"index": index, "queries": queries, "k": k, "scorer": scorer}).encode()
+        req = urllib.request.Request(endpoint, body, {"Content-Type": "application/json"})
+        with urllib.request.urlopen(req) as resp:
+            return json.load(resp)
+    return send
+
+def local_client(index_dir: str, index: str, k: int, scorer: str):
+    # Same query path without HTTP, to separate server overhead from search cost
+    import os
+    from query_language import run_query
+    path = os.path.join(index_dir, index)
+    def send(queries: list[str]):
+        return {"responses": [{"results": run_query(path, q, k, scorer).ranked} for q in queries]}
+    return send
+
+def run_load(send, queries: list[str], concurrency: int, requests: int, batch: int = 1, warmup: int = 10) -> dict:
+    for i in range(min(warmup, requests)):
+        send(queries[i * batch % len(queries):][:batch] or queries[:batch])
+
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client():
+        nonlocal errors
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = i * batch % len(queries)
+            chunk = (queries[start:] + queries[:start])[:batch]
+            t0 = time.perf_counter()
+            try:
+                result = send(chunk)
+                failed = any("error" in r for r in result.get("responses", []))
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed)
+                errors += failed
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    ms = [x * 1000 for x in latencies]
+    return {
+        "requests": len(latencies),
+        "queries": len(latencies) * batch,
+        "errors": errors,
+        "concurrency": concurrency,
+        "batch": batch,
+        "wall_s": wall,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "qps": len(latencies) * batch / wall if wall else 0.0,
+        "mean_ms": sum(ms) / len(ms) if ms else 0.0,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": ms[-1] if ms else 0.0,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Load-test the /api/search endpoint and report latency percentiles and QPS")
+    ap.add_argument("index", help="Index file name in the output directory")
+    ap.add_argument("--url", default=DEFAULT_URL, help=f"Server base URL (default: {DEFAULT_URL})")
+    ap.add_argument("--local", action="store_true", help="Call the query code in-process instead of over HTTP")
+    ap.add_argument("--index-dir", default="output", help="Where the index lives, for --local and query sampling")
+    ap.add_argument("--queries", help="File with one query per line (default: sampled from the index)")
+    ap.add_argument("--sample", type=int, default=500, help="Number of queries to sample when --queries is not given")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                    help="Client counts to run, one measurement each")
+    ap.add_argument("--requests", type=int, default=1000, help="Requests per measurement")
+    ap.add_argument("--batch", type=int, default=1, help="Queries per request")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--scorer", default="counts")
+    ap.add_argument("--json", help="Also write the results to this JSON file")
+    args = ap.parse_args()
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        import os
+        queries = sample_queries(os.path.join(args.index_dir, args.index), args.sample, args.seed)
+    if not queries:
+        print("No queries to send", file=sys.stderr)
+        sys.exit(1)
+
+    make = local_client if args.local else http_client
+    send = make(args.index_dir if args.local else args.url, args.index, args.k, args.scorer)
+    try:
+        send(queries[:args.batch])
+    except Exception as e:
+        detail = e.read().decode(errors="replace").strip() if hasattr(e, "read") else ""
+        print(f"First request failed: {e} {detail}", file=sys.stderr)
+        sys.exit(1)
+    results = []
+    print(f"{'clients':>7} {'QPS':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for c in args.concurrency:
+        r = run_load(send, queries, c, args.requests, args.batch)
+        results.append(r)
+        print(f"{c:>7} {r['qps']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['errors']:>6}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"index": args.index, "mode": "local" if args.local else args.url,
+                       "scorer": args.scorer, "k": args.k, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,16 @@
+import gzip
+import io
+import threading
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
+from typing import Sequence
+from index_meta import read_meta
+
+try:
+    import numpy as np
+except ImportError:  # optional: intersections fall back to galloping in pure Python
+    np = None
 
 STOP_WORDS = {
     "a","about","above","after","again","against","all","am","an","and","any","are","as","at","be","because","been","before",
@@ -29,15 +41,52 @@ class PorterStemmer:
 
 _stemmer = PorterStemmer()
 
+# Identifies what stem() does. Builders record it in the index sidecar so that
+# load_index can skip re-stemming terms that already went through it.
+NORMALIZATION = {"stemmer": "query_index.PorterStemmer-v1", "stop_words": "query_index-v1"}
+
+# Optional positional sidecar: "term<TAB>doc:p1,p2,... doc:p1,..." with token offsets per document
+POSITIONS_SUFFIX = ".pos"
+
+# Index text may be gzip/zstd-compressed; detected from the magic bytes, not the name
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+def open_binary(fp: str):
+    # Decompressed bytes; offsets into it are offsets into the uncompressed text
+    with open(fp, "rb") as f:
+        head = f.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return gzip.open(fp, "rb")
+    if head.startswith(ZSTD_MAGIC):
+        try: import zstandard
+        except ImportError: raise RuntimeError(f"{fp} is zstd-compressed; install the 'zstandard' package to read it")
+        # The zstd reader has no readline(); buffering adds it (seeking stays unsupported)
+        return io.BufferedReader(zstandard.open(fp, "rb"))
+    return open(fp, "rb")
+
+def is_compressed(fp: str) -> bool:
+    with open(fp, "rb") as f:
+        head = f.read(4)
+    return head.startswith((GZIP_MAGIC, ZSTD_MAGIC))
+
+def open_text(fp: str):
+    with open(fp, "rb") as f:
+        head = f.read(4)
+    if head.startswith((GZIP_MAGIC, ZSTD_MAGIC)):
+        return io.TextIOWrapper(open_binary(fp), encoding="utf-8")
+    return open(fp, encoding="utf-8")
+
 def stem(word: str) -> str:
     w = word.lower()
     if w in STOP_WORDS: return ""
     return _stemmer.stem(w) or ""
 
-def _parse_index_line(line: str) -> tuple[str, dict[str, int]]:
+def _parse_index_line(line: str, normalize: bool = True) -> tuple[str, dict[str, int]]:
     parts = line.split()
     if not parts: return "", {}
-    term = stem(parts[0])
+    term = stem(parts[0]) if normalize else parts[0]
     if not term: return "", {}
     postings = {}
     for item in parts[1:]:
@@ -47,17 +96,165 @@ def _parse_index_line(line: str) -> tuple[str, dict[str, int]]:
             except: pass
     return term, postings
 
-def load_index(fp: str) -> dict[str, dict[str, int]]:
-    idx = defaultdict(dict)
-    with open(fp, encoding="utf-8") as f:
+class TextIndex(defaultdict):
+    # term -> {doc: count}, with per-term statistics and doc-id postings memoized on first use
+    def __init__(self, default_factory=dict):
+        super().__init__(default_factory)
+        self._max_counts: dict[str, int] = {}
+        self._doc_ids: dict[str, array] = {}
+        self._doc_counts: dict[str, array] = {}
+        self._doc_names: list[str] | None = None
+        self._doc_index: dict[str, int] = {}
+        self._sorted_terms: list[str] | None = None
+        self._table_lock = threading.Lock()
+
+    def _doc_table(self) -> dict[str, int]:
+        # Ids follow sorted doc names, like the binary format; built once on first use
+        with self._table_lock:
+            if self._doc_names is None:
+                self._doc_names = sorted({d for postings in self.values() for d in postings})
+                self._doc_index = {d: i for i, d in enumerate(self._doc_names)}
+        return self._doc_index
+
+    def doc_ids(self, term: str) -> array:
+        ids = self._doc_ids.get(term)
+        if ids is None:
+            table = self._doc_table()
+            ids = self._doc_ids[term] = array("I", sorted(table[d] for d in self.get(term, {})))
+        return ids
+
+    def doc_counts(self, term: str) -> array:
+        # Counts aligned with doc_ids(term)
+        counts = self._doc_counts.get(term)
+        if counts is None:
+            ids, postings = self.doc_ids(term), self.get(term, {})
+            counts = self._doc_counts[term] = array("I", (postings[self._doc_names[i]] for i in ids))
+        return counts
+
+    def terms_with_prefix(self, prefix: str) -> list[str]:
+        with self._table_lock:
+            if self._sorted_terms is None:
+                self._sorted_terms = sorted(t for t, p in self.items() if p)
+        terms = self._sorted_terms
+        lo = bisect_left(terms, prefix)
+        hi = bisect_left(terms, prefix[:-1] + chr(ord(prefix[-1]) + 1)) if prefix else len(terms)
+        return terms[lo:hi]
+
+    @property
+    def n_docs(self) -> int:
+        if self._doc_names is None:
+            self._doc_table()
+        return len(self._doc_names)
+
+    def doc_name(self, doc_id: int) -> str:
+        if self._doc_names is None:
+            self._doc_table()
+        return self._doc_names[doc_id]
+
+    def max_count(self, term: str) -> int:
+        m = self._max_counts.get(term)
+        if m is None:
+            m = self._max_counts[term] = max(self.get(term, {}).values(), default=0)
+        return m
+
+def load_index(fp: str) -> TextIndex:
+    idx = TextIndex()
+    # Terms the builder already normalized are taken as-is instead of re-stemmed and merged
+    normalize = read_meta(fp).get("normalization") != NORMALIZATION
+    with open_text(fp) as f:
         for line in f:
-            t,p = _parse_index_line(line)
+            t,p = _parse_index_line(line, normalize)
             if not t: continue
+            if not normalize and t not in idx:
+                idx[t] = p
+                continue
             for d,c in p.items():
                 idx[t][d] = idx[t].get(d,0) + c
     return idx
 
+def load_positions(fp: str) -> dict[str, dict[str, list[int]]]:
+    idx = defaultdict(dict)
+    normalize = read_meta(fp.removesuffix(POSITIONS_SUFFIX)).get("normalization") != NORMALIZATION
+    with open_text(fp) as f:
+        for line in f:
+            parts = line.split()
+            if not parts: continue
+            t = stem(parts[0]) if normalize else parts[0]
+            if not t: continue
+            for item in parts[1:]:
+                d,_,ps = item.partition(':')
+                try: pos = [int(p) for p in ps.split(',')]
+                except ValueError: continue
+                # Several raw terms can share a stem; keep each doc's list sorted
+                idx[t][d] = sorted(idx[t][d] + pos) if d in idx[t] else pos
+    return idx
+
+# Intersect through a bitmap once the shorter list is at least 1/BITMAP_RATIO of the longer
+BITMAP_RATIO = 32
+
+def gallop(ids: Sequence[int], target: int, lo: int) -> int:
+    # First position >= lo holding a value >= target: double the step, then bisect the last gap
+    step, hi = 1, lo
+    while hi < len(ids) and ids[hi] < target:
+        lo = hi + 1
+        hi += step
+        step <<= 1
+    return bisect_left(ids, target, lo, min(hi, len(ids)))
+
+def _as_uint32(ids: Sequence[int]):
+    # Zero-copy for array('I') and mmap slices; lists and ranges from query plans are copied
+    if isinstance(ids, (array, memoryview)) and len(ids):
+        return np.frombuffer(ids, dtype=np.uint32)
+    return np.asarray(ids, dtype=np.uint32)
+
+def intersect_sorted(lists: list[Sequence[int]], n_docs: int | None = None) -> list[int]:
+    # Smallest list first; each survivor is searched for in the next list, in order
+    lists = sorted(lists, key=len)
+    if not lists or not len(lists[0]): return []
+    if np is not None:
+        # Zero-copy views of the u32 buffers: a batched binary search when the survivors are
+        # few, otherwise a membership bitmap over all doc ids
+        res = _as_uint32(lists[0])
+        for other in lists[1:]:
+            o = _as_uint32(other)
+            if n_docs is not None and len(res) * BITMAP_RATIO >= len(o):
+                mask = np.zeros(n_docs, dtype=bool)
+                mask[res] = True
+                res = o[mask[o]]
+            else:
+                pos = np.searchsorted(o, res)
+                res = res[pos < len(o)]
+                res = res[o[pos[:len(res)]] == res]
+            if not len(res): break
+        return res.tolist()
+    res = list(lists[0])
+    for other in lists[1:]:
+        if not res: break
+        out, pos = [], 0
+        for x in res:
+            pos = gallop(other, x, pos)
+            if pos == len(other): break
+            if other[pos] == x: out.append(x)
+        res = out
+    return res
+
+def union_sorted(lists: list[Sequence[int]]) -> list[int]:
+    if np is not None:
+        arrays = [_as_uint32(ids) for ids in lists if len(ids)]
+        return np.unique(np.concatenate(arrays)).tolist() if arrays else []
+    return sorted(set().union(*lists))
+
+def difference_sorted(ids: Sequence[int], exclude: Sequence[int]) -> list[int]:
+    if not len(exclude): return list(ids)
+    drop = set(exclude)
+    return [x for x in ids if x not in drop]
+
 def docs_with_all_terms(index: dict[str, dict[str, int]], terms: list[str]) -> set[str]:
+    if hasattr(index, "doc_ids"):
+        stems = {s for s in map(stem, terms) if s}
+        if not stems: return set()
+        ids = intersect_sorted([index.doc_ids(s) for s in stems], index.n_docs)
+        return {index.doc_name(i) for i in ids}
     res = None
     for t in terms:
         s = stem(t)
@@ -0,0 +1,236 @@
+import re
+from typing import NamedTuple, Sequence
+from query_index import stem, intersect_sorted, union_sorted, difference_sorted
+from tokenizer import tokenize
+from index_cache import get_index
+from document_scorer import phrase_matcher, top_k_documents, DEFAULT_SCORER
+
+# Grammar, loosest first. Operators are upper-case words; lower-case and/or/not are stop words.
+#   query := conj ([OR] conj)*      adjacent clauses are OR'ed, as plain searches always were,
+#                                   but adjacent NOT clauses exclude from all their neighbours:
+#                                   "cloud data NOT service" is (cloud OR data) AND NOT service
+#   conj  := unary (AND unary)*
+#   unary := NOT unary | atom
+#   atom  := "(" query ")" | '"' words '"' | word | prefix*
+# Nodes are tuples: ("term", word, stem), ("phrase", words), ("prefix", prefix),
+# ("and", nodes), ("or", nodes), ("not", node). Clauses of nothing but stop words become None.
+_TOKEN_RE = re.compile(r'\(|\)|"[^"]*"?|[^\s()"]+')
+OPERATORS = ("AND", "OR", "NOT")
+
+class QuerySyntaxError(ValueError):
+    pass
+
+def _combine(op: str, nodes: list):
+    nodes = [n for n in nodes if n is not None]
+    if not nodes: return None
+    return nodes[0] if len(nodes) == 1 else (op, nodes)
+
+def _words(words: list[str]):
+    # A bare word can tokenize into several (e.g. "map-reduce"); those must stay adjacent
+    if not any(stem(w) for w in words): return None
+    if len(words) == 1: return ("term", words[0], stem(words[0]))
+    return ("phrase", words)
+
+class _Parser:
+    def __init__(self, query: str):
+        self.tokens = _TOKEN_RE.findall(query)
+        self.i = 0
+
+    def peek(self) -> str | None:
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def take(self) -> str | None:
+        tok = self.peek()
+        self.i += 1
+        return tok
+
+    def parse(self):
+        node = self.query()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"Unexpected {self.peek()!r}")
+        return node
+
+    def query(self):
+        # Runs of adjacent clauses, split by explicit ORs
+        runs = [[self.conj()]]
+        while self.peek() not in (None, ")"):
+            if self.peek() == "OR":
+                self.take()
+                runs.append([])
+            runs[-1].append(self.conj())
+        alternatives = []
+        for run in runs:
+            run = [n for n in run if n is not None]
+            exclude = [n for n in run if n[0] == "not"]
+            include = _combine("or", [n for n in run if n[0] != "not"])
+            if include is not None and include[0] == "and":
+                exclude = include[1] + exclude
+                include = None
+            alternatives.append(_combine("and", [include] + exclude))
+        return _combine("or", alternatives)
+
+    def conj(self):
+        parts = [self.unary()]
+        while self.peek() == "AND":
+            self.take()
+            parts.append(self.unary())
+        return _combine("and", parts)
+
+    def unary(self):
+        if self.peek() == "NOT":
+            self.take()
+            child = self.unary()
+            return None if child is None else ("not", child)
+        return self.atom()
+
+    def atom(self):
+        tok = self.take()
+        if tok is None:
+            raise QuerySyntaxError("Query ends where a term was expected")
+        if tok in OPERATORS or tok == ")":
+            raise QuerySyntaxError(f"Unexpected {tok!r}")
+        if tok == "(":
+            node = self.query()
+            if self.take() != ")":
+                raise QuerySyntaxError("Missing closing parenthesis")
+            return node
+        if tok.startswith('"'):
+            if len(tok) < 2 or not tok.endswith('"'):
+                raise QuerySyntaxError("Unterminated quoted phrase")
+            return _words(tokenize(tok[1:-1]))
+        if tok.endswith("*"):
+            words = tokenize(tok[:-1])
+            if len(words) != 1:
+                raise QuerySyntaxError(f"A wildcard needs a single-word prefix: {tok!r}")
+            return ("prefix", words[0])
+        return _words(tokenize(tok))
+
+def parse_query(query: str):
+    return _Parser(query).parse()
+
+# Execution plan: every node estimates its result size up front so conjunctions can run
+# their cheapest inputs first, and run() returns sorted doc ids.
+
+class _Scan:
+    def __init__(self, index, term: str):
+        self.term, self.ids = term, index.doc_ids(term)
+        self.size = len(self.ids)
+
+    def run(self) -> Sequence[int]:
+        return self.ids
+
+    def explain(self) -> str:
+        return f"{self.term}[{self.size}]"
+
+class _Union:
+    def __init__(self, index, children: list, label: str = "OR"):
+        self.children, self.label = children, label
+        self.size = min(index.n_docs, sum(c.size for c in children))
+
+    def run(self) -> Sequence[int]:
+        return union_sorted([c.run() for c in self.children])
+
+    def explain(self) -> str:
+        return f"{self.label}({', '.join(c.explain() for c in self.children)})"
+
+class _Intersect:
+    def __init__(self, index, include: list, exclude: list):
+        self.index = index
+        self.include = sorted(include, key=lambda c: c.size)
+        self.exclude = exclude
+        self.size = self.include[0].size if self.include else index.n_docs
+
+    def run(self) -> Sequence[int]:
+        if self.include:
+            ids = self.include[0].run()
+            for c in self.include[1:]:
+                if not len(ids): return []
+                ids = intersect_sorted([ids, c.run()], self.index.n_docs)
+        else:
+            ids = range(self.index.n_docs)
+        for c in self.exclude:
+            if not len(ids): return []
+            ids = difference_sorted(ids, c.run())
+        return ids
+
+    def explain(self) -> str:
+        parts = [c.explain() for c in self.include] + [f"NOT {c.explain()}" for c in self.exclude]
+        return f"AND({', '.join(parts)})"
+
+class _Phrase(_Intersect):
+    def __init__(self, index, index_path: str, words: list[str]):
+        super().__init__(index, [_Scan(index, s) for s in {stem(w) for w in words} if s], [])
+        self.words = words
+        self.matches = phrase_matcher(index_path, words)
+
+    def run(self) -> Sequence[int]:
+        return [i for i in super().run() if self.matches(self.index.doc_name(i))]
+
+    def explain(self) -> str:
+        return f'PHRASE("{" ".join(self.words)}", {super().explain()})'
+
+def compile_query(node, index, index_path: str):
+    kind = node[0]
+    if kind == "term":
+        return _Scan(index, node[2])
+    if kind == "phrase":
+        return _Phrase(index, index_path, node[1])
+    if kind == "prefix":
+        return _Union(index, [_Scan(index, t) for t in index.terms_with_prefix(node[1])], f"{node[1]}*")
+    if kind == "or":
+        return _Union(index, [compile_query(n, index, index_path) for n in node[1]])
+    if kind == "not":
+        return _Intersect(index, [], [compile_query(node[1], index, index_path)])
+    include = [compile_query(n, index, index_path) for n in node[1] if n[0] != "not"]
+    exclude = [compile_query(n[1], index, index_path) for n in node[1] if n[0] == "not"]
+    return _Intersect(index, include, exclude)
+
+def is_plain(node) -> bool:
+    # Bare words and prefixes only: the form the search box always accepted
+    if node[0] == "or":
+        return all(is_plain(n) for n in node[1])
+    return node[0] in ("term", "prefix")
+
+def ranking_terms(node, index) -> tuple[list[str], list[str]]:
+    # Words of the positive clauses (for the phrase bonus) and the index terms to rank on
+    words, terms = [], []
+    def walk(n):
+        if n[0] == "term":
+            words.append(n[1])
+            terms.append(n[2])
+        elif n[0] == "phrase":
+            words.extend(n[1])
+            terms.extend(s for s in map(stem, n[1]) if s)
+        elif n[0] == "prefix":
+            terms.extend(index.terms_with_prefix(n[1]))
+        elif n[0] in ("and", "or"):
+            for c in n[1]:
+                walk(c)
+    walk(node)
+    return words, terms
+
+class QueryResult(NamedTuple):
+    ranked: list[tuple[str, float]]
+    matches: set[str]
+    plan: str
+    # Plain queries rank any-term matches and list docs with every term as before;
+    # otherwise both follow the boolean expression
+    plain: bool
+
+def run_query(index_path: str, query: str, k: int = 5, scorer: str = DEFAULT_SCORER) -> QueryResult:
+    node = parse_query(query)
+    if node is None:
+        return QueryResult([], set(), "", True)
+    index = get_index(index_path)
+    plain = is_plain(node)
+    # Plain queries list the docs holding every term, so plan their conjunction
+    filter_node = ("and", node[1]) if plain and node[0] == "or" else node
+    plan = compile_query(filter_node, index, index_path)
+    ids = plan.run()
+    matches = {index.doc_name(i) for i in ids}
+    words, terms = ranking_terms(node, index)
+    if not terms:
+        # Negation only: nothing to score on, so list the allowed docs in name order
+        return QueryResult([(d, 0) for d in sorted(matches)[:k]], matches, plan.explain(), plain)
+    ranked = top_k_documents(index_path, words, k, scorer, stems=terms, allowed=None if plain else set(ids))
+    return QueryResult(ranked, matches, plan.explain(), plain)
@@ -1,36 +1,189 @@
-import sys
+import argparse
+from collections import Counter, defaultdict
 from pathlib import Path
 from pyspark.sql import SparkSession
-from query_index import stem, STOP_WORDS
+from pyspark.sql import functions as F
+from query_index import STOP_WORDS
+from stem_cache import cached_stem, STEM_CACHE_SIZE
+from tokenizer import tokenize
 
-def tokenize(text: str) -> list[str]:
-    cleaned = []
-    for ch in text.lower():
-        cleaned.append(ch if ch.isalnum() else " ")
-    return "".join(cleaned).split()
+AGGREGATIONS = ("groupbykey", "combine")
+ENGINES = ("rdd", "dataframe")
+INPUT_MODES = ("whole", "lines")
+# Stands in for the isalnum() check of tokenizer.tokenize, applied by the JVM instead
+NON_ALNUM = r"[^\p{L}\p{N}]+"
 
-def main(inp: str, out: str, parts: int):
+def _report_cache(stem, before, hits, misses):
+    after = stem.cache_info()
+    hits.add(after.hits - before.hits)
+    misses.add(after.misses - before.misses)
+
+def term_pairs(records, stop_words, cache_size, hits, misses):
+    # Each token is stemmed once; cache hit/miss deltas go to the driver via accumulators
+    stem = cached_stem(cache_size)
+    before = stem.cache_info()
+    for path, text in records:
+        doc = Path(path).name
+        for w in tokenize(text):
+            s = stem(w) if w not in stop_words else ""
+            if s:
+                yield (s, doc), 1
+    _report_cache(stem, before, hits, misses)
+
+def doc_postings(records, stop_words, cache_size, hits, misses):
+    # Counted per document before anything leaves the task: one (term, (doc, count)) per pair.
+    # In line input mode consecutive records of one file are folded together first.
+    stem = cached_stem(cache_size)
+    before = stem.cache_info()
+    path, doc, counts = None, None, Counter()
+    for record_path, text in records:
+        if record_path != path:
+            yield from ((s, (doc, c)) for s, c in counts.items())
+            path, doc, counts = record_path, Path(record_path).name, Counter()
+        counts.update(s for s in (stem(w) for w in tokenize(text) if w not in stop_words) if s)
+    yield from ((s, (doc, c)) for s, c in counts.items())
+    _report_cache(stem, before, hits, misses)
+
+def _new_postings(v: tuple[str, int]) -> dict[str, int]:
+    return {v[0]: v[1]}
+
+def _add_posting(acc: dict[str, int], v: tuple[str, int]) -> dict[str, int]:
+    acc[v[0]] = acc.get(v[0], 0) + v[1]
+    return acc
+
+def _merge_postings(a: dict[str, int], b: dict[str, int]) -> dict[str, int]:
+    for doc, c in b.items():
+        a[doc] = a.get(doc, 0) + c
+    return a
+
+def _format_postings(kv) -> str:
+    return f"{kv[0]}\t" + "\t".join(sorted(f"{d}:{c}" for d, c in kv[1].items()))
+
+def positions(kv, stop_words, cache_size) -> list[tuple[str, str]]:
+    # Offsets count every token, stop-words included, so adjacent query terms stay adjacent
+    stem = cached_stem(cache_size)
+    offsets = defaultdict(list)
+    for i, w in enumerate(tokenize(kv[1])):
+        s = stem(w) if w not in stop_words else ""
+        if s:
+            offsets[s].append(i)
+    doc = Path(kv[0]).name
+    return [(s, f"{doc}:{','.join(map(str, ps))}") for s, ps in offsets.items()]
+
+def read_text(spark: SparkSession, inp: str, parts: int, input_mode: str):
+    # Line mode reads splittable blocks, so one huge file is cut into at least `parts`
+    # splits instead of becoming a single whole-file record on one executor
+    if input_mode == "lines":
+        spark.conf.set("spark.sql.files.minPartitionNum", parts)
+    return spark.read.text(inp, wholetext=input_mode == "whole")
+
+def read_records(spark: SparkSession, inp: str, parts: int, input_mode: str):
+    if input_mode == "whole":
+        return spark.sparkContext.wholeTextFiles(inp)
+    return read_text(spark, inp, parts, input_mode).select(F.input_file_name(), "value").rdd.map(tuple)
+
+def main_dataframe(spark: SparkSession, inp: str, out: str, parts: int, with_positions: bool,
+                   stem_cache_size: int, input_mode: str = "whole"):
+    # Tokenizing, filtering and aggregation run as JVM SQL expressions; only stemming crosses
+    # into Python, as Arrow batches through a pandas UDF
+    import pandas as pd
+    from pyspark.sql.functions import pandas_udf
+
+    @pandas_udf("string")
+    def stem_words(words: pd.Series) -> pd.Series:
+        return words.map(cached_stem(stem_cache_size))
+
+    spark.conf.set("spark.sql.shuffle.partitions", parts)
+    tokens = (
+        read_text(spark, inp, parts, input_mode)
+             .select(F.regexp_extract(F.input_file_name(), r"([^/]+)$", 1).alias("doc"),
+                     F.posexplode(F.split(F.trim(F.regexp_replace(F.lower("value"), NON_ALNUM, " ")), " "))
+                      .alias("pos", "word"))
+             .where((F.col("word") != "") & ~F.col("word").isin(*STOP_WORDS))
+             .withColumn("term", stem_words("word"))
+             .where(F.col("term") != "")
+    )
+    if with_positions:
+        tokens.cache()
+    (
+        tokens.groupBy("term", "doc").agg(F.count("*").alias("cnt"))
+              .groupBy("term")
+              .agg(F.sort_array(F.collect_list(F.concat_ws(":", "doc", F.col("cnt").cast("string")))).alias("postings"))
+              .select(F.concat_ws("\t", "term", F.array_join("postings", "\t")))
+              .write.text(out)
+    )
+    if with_positions:
+        (
+            tokens.groupBy("term", "doc")
+                  .agg(F.array_join(F.sort_array(F.collect_list("pos")), ",").alias("offsets"))
+                  .groupBy("term")
+                  .agg(F.sort_array(F.collect_list(F.concat_ws(":", "doc", "offsets"))).alias("postings"))
+                  .select(F.concat_ws("\t", "term", F.array_join("postings", "\t")))
+                  .write.text(out + "_positions")
+        )
+
+def main(inp: str, out: str, parts: int, with_positions: bool = False, stem_cache_size: int = STEM_CACHE_SIZE,
+         aggregation: str = "groupbykey", engine: str = "rdd", input_mode: str = "whole"):
     spark = SparkSession.builder.appName("Spark-Inverted-Index").getOrCreate()
+    if engine == "dataframe":
+        main_dataframe(spark, inp, out, parts, with_positions, stem_cache_size, input_mode)
+        spark.stop()
+        return
     sc = spark.sparkContext
     sw = sc.broadcast(STOP_WORDS)
-    files = sc.wholeTextFiles(inp)
-    pairs = (
-        files.flatMap(lambda kv: [
-            ((stem(w), Path(kv[0]).name), 1)
-            for w in tokenize(kv[1])
-            if w not in sw.value and stem(w)
-        ])
-        .reduceByKey(lambda a,b: a+b, numPartitions=parts)
-    )
-    word_map = pairs.map(lambda kv: (kv[0][0], f"{kv[0][1]}:{kv[1]}"))
-    index = (
-        word_map.groupByKey()
-                .mapValues(lambda vals: "\t".join(sorted(vals)))
-                .map(lambda kv: f"{kv[0]}\t{kv[1]}")
-    )
+    stem_hits = sc.accumulator(0)
+    stem_misses = sc.accumulator(0)
+    files = read_records(spark, inp, parts, input_mode)
+    if with_positions:
+        files.cache()
+    if aggregation == "combine":
+        # Postings dicts are built map-side and merged in a single shuffle keyed by term
+        index = (
+            files.mapPartitions(lambda recs: doc_postings(recs, sw.value, stem_cache_size, stem_hits, stem_misses))
+                 .combineByKey(_new_postings, _add_posting, _merge_postings, numPartitions=parts)
+                 .map(_format_postings)
+        )
+    else:
+        pairs = (
+            files.mapPartitions(lambda recs: term_pairs(recs, sw.value, stem_cache_size, stem_hits, stem_misses))
+            .reduceByKey(lambda a,b: a+b, numPartitions=parts)
+        )
+        word_map = pairs.map(lambda kv: (kv[0][0], f"{kv[0][1]}:{kv[1]}"))
+        index = (
+            word_map.groupByKey()
+                    .mapValues(lambda vals: "\t".join(sorted(vals)))
+                    .map(lambda kv: f"{kv[0]}\t{kv[1]}")
+        )
     index.saveAsTextFile(out)
+    lookups = stem_hits.value + stem_misses.value
+    print(f"Stem cache: {stem_hits.value} hits, {stem_misses.value} misses"
+          f" ({100 * stem_hits.value / max(lookups, 1):.1f}% hit rate, size {stem_cache_size})")
+    if with_positions:
+        (
+            files.flatMap(lambda kv: positions(kv, sw.value, stem_cache_size))
+                 .groupByKey(numPartitions=parts)
+                 .mapValues(lambda vals: "\t".join(sorted(vals)))
+                 .map(lambda kv: f"{kv[0]}\t{kv[1]}")
+                 .saveAsTextFile(out + "_positions")
+        )
     spark.stop()
 
 if __name__=="__main__":
-    if len(sys.argv)!=4: sys.exit(1)
-    main(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+    ap = argparse.ArgumentParser()
+    ap.add_argument("input")
+    ap.add_argument("output")
+    ap.add_argument("partitions", type=int)
+    ap.add_argument("--positions", action="store_true", help="also write token positions to <output>_positions")
+    ap.add_argument("--stem-cache-size", type=int, default=STEM_CACHE_SIZE, help="LRU entries per executor worker")
+    ap.add_argument("--aggregation", choices=AGGREGATIONS, default="groupbykey",
+                    help="'combine' builds postings map-side with combineByKey (one shuffle) instead of "
+                         "reduceByKey + groupByKey; compare Shuffle Write in the Spark UI")
+    ap.add_argument("--engine", choices=ENGINES, default="rdd",
+                    help="'dataframe' tokenizes with Spark SQL functions and stems with a pandas UDF")
+    ap.add_argument("--input-mode", choices=INPUT_MODES, default="whole",
+                    help="'lines' splits large files into line-based partitions instead of one record per file")
+    args = ap.parse_args()
+    if args.positions and args.input_mode != "whole":
+        ap.error("--positions needs --input-mode whole: token offsets are counted per whole document")
+    main(args.input, args.output, args.partitions, args.positions, args.stem_cache_size, args.aggregation,
+         args.engine, args.input_mode)
@@ -0,0 +1,15 @@
+from functools import lru_cache
+from typing import Callable
+from query_index import stem
+
+# Vocabularies are Zipfian, so a modest LRU absorbs most stem() calls. One cache lives
+# per Python worker process and survives across tasks when Spark reuses the worker.
+STEM_CACHE_SIZE = 1 << 17
+
+_cached_stem = None
+
+def cached_stem(maxsize: int = STEM_CACHE_SIZE) -> Callable[[str], str]:
+    global _cached_stem
+    if _cached_stem is None or _cached_stem.cache_parameters()["maxsize"] != maxsize:
+        _cached_stem = lru_cache(maxsize=maxsize)(stem)
+    return _cached_stem
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are flat files run from invertedindex/, as app.py and the build scripts do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
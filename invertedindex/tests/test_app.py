@@ -0,0 +1,72 @@
+import pytest
+
+import app as webapp
+from binary_index import write_binary_index
+from index_segments import update
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(webapp, "INDEX_DIR", str(tmp_path))
+    return webapp.app.test_client()
+
+
+def test_output_viewer_pages_segmented_binary_index(tmp_path, client):
+    index_path = tmp_path / "index.idx"
+    write_binary_index({"cloud": {"doc1.txt": 2, "doc2.txt": 1}, "storag": {"doc1.txt": 1}}, str(index_path))
+    new = tmp_path / "doc6.txt"
+    new.write_text("cloud network", encoding="utf-8")
+    update(str(index_path), [str(new)])
+
+    page = client.get("/output/index.idx").get_data(as_text=True)
+    assert page.count("\n") >= 3
+    assert "cloud\tdoc1.txt:2\tdoc2.txt:1\tdoc6.txt:1" in page
+    assert "network\tdoc6.txt:1" in page
+
+    jumped = client.get("/output/index.idx?prefix=st").get_data(as_text=True)
+    assert "storag\tdoc1.txt:1" in jumped
+    assert "cloud\t" not in jumped
+
+
+def test_negation_only_search_lists_matching_documents(tmp_path, client, monkeypatch):
+    index_path = tmp_path / "index.idx"
+    write_binary_index({"cloud": {"doc1.txt": 2, "doc2.txt": 1, "doc3.txt": 1}, "storage": {"doc1.txt": 1}},
+                       str(index_path))
+    monkeypatch.setattr(webapp, "current_index_path", str(index_path))
+
+    page = client.post("/search", data={"query": "NOT storage"}).get_data(as_text=True)
+    assert "No results found." not in page
+    ranked = page.split("Ranked Results", 1)[1]
+    assert "doc2.txt" in ranked and "doc3.txt" in ranked
+    assert "doc1.txt" not in ranked
+
+
+def test_output_viewer_pages_unsorted_text_index_in_term_order(tmp_path, client):
+    (tmp_path / "spark.txt").write_text("cloud\tdoc1.txt:1\nappl\tdoc2.txt:1\nbig\tdoc1.txt:2\n", encoding="utf-8")
+
+    page = client.get("/output/spark.txt").get_data(as_text=True)
+    assert page.index("appl\t") < page.index("big\t") < page.index("cloud\t")
+    jumped = client.get("/output/spark.txt?prefix=b").get_data(as_text=True)
+    assert "big\tdoc1.txt:2" in jumped and "appl\t" not in jumped
+
+
+def test_adjacent_not_clause_excludes_from_its_neighbours(tmp_path, client, monkeypatch):
+    index_path = tmp_path / "index.idx"
+    write_binary_index({"cloud": {"doc1.txt": 2, "doc2.txt": 1}, "data": {"doc3.txt": 1},
+                        "service": {"doc2.txt": 1}}, str(index_path))
+    monkeypatch.setattr(webapp, "current_index_path", str(index_path))
+
+    page = client.post("/search", data={"query": "cloud data NOT service"}).get_data(as_text=True)
+    ranked = page.split("Ranked Results", 1)[1]
+    assert "doc1.txt" in ranked and "doc3.txt" in ranked
+    assert "doc2.txt" not in ranked
+
+
+def test_stop_word_only_search_goes_through_the_query_parser(tmp_path, client, monkeypatch):
+    index_path = tmp_path / "index.idx"
+    write_binary_index({"cloud": {"doc1.txt": 1}}, str(index_path))
+    monkeypatch.setattr(webapp, "current_index_path", str(index_path))
+
+    response = client.post("/search", data={"query": "the and"})
+    assert response.status_code == 200
+    assert "No results found." in response.get_data(as_text=True)
@@ -0,0 +1,40 @@
+import sys
+import time
+
+from build_jobs import CANCELLED, RUNNING, SUCCEEDED, JobManager
+
+
+def _wait(job):
+    for _ in job.follow(poll=0.05):
+        pass
+
+
+def test_cancel_only_unfinished_jobs():
+    manager = JobManager(max_concurrent=1)
+    running = manager.submit([sys.executable, "-c", "import time; time.sleep(0.5)"])
+    queued = manager.submit([sys.executable, "-c", "pass"])
+
+    assert manager.cancel(queued.id)
+    assert queued.status == CANCELLED
+    assert not manager.cancel(queued.id)
+
+    _wait(running)
+    assert running.status == SUCCEEDED
+    assert not manager.cancel(running.id)
+    assert running.status == SUCCEEDED and running.returncode == 0
+    assert not manager.cancel("missing")
+
+
+def test_cancel_after_exit_does_not_relabel_a_successful_build():
+    manager = JobManager(max_concurrent=1)
+    job = manager.submit([sys.executable, "-c", "import time; time.sleep(0.2)"])
+    while job.proc is None:
+        time.sleep(0.01)
+    # Holding the job's lock keeps _run from recording the exit status: the cancel lands after
+    # the process exited but before its status is known
+    with job._changed:
+        job.proc.wait()
+        assert job.status == RUNNING
+        assert not manager.cancel(job.id)
+    _wait(job)
+    assert job.status == SUCCEEDED and job.returncode == 0
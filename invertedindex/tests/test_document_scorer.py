@@ -0,0 +1,46 @@
+import random
+from collections import Counter
+
+import pytest
+
+from binary_index import write_binary_index
+from document_scorer import SCORERS, make_scorer, top_k_documents
+from index_cache import get_index
+
+
+def _brute_force(index_path, stems, k, scorer):
+    index = get_index(index_path)
+    sc = make_scorer(scorer, index_path, index)
+    scores, hits = Counter(), Counter()
+    for s, w in Counter(stems).items():
+        ids, counts = index.doc_ids(s), index.doc_counts(s)
+        term_score = sc.term_scorer(s, len(ids))
+        for d, c in zip(ids, counts):
+            scores[d] += w * term_score(d, c)
+            hits[d] += 1
+    for d in scores:
+        if hits[d] == len(set(stems)):
+            scores[d] += sc.partial_bonus
+    ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:k]
+    return [(index.doc_name(d), s) for d, s in ranked]
+
+
+@pytest.mark.parametrize("scorer", sorted(SCORERS))
+def test_top_k_matches_exhaustive_ranking(tmp_path, scorer):
+    rng = random.Random(13)
+    terms = [f"term{i}" for i in range(12)]
+    index = {}
+    for i, t in enumerate(terms):
+        # Skewed list lengths and counts, with many ties
+        docs = rng.sample(range(300), max(3, 300 // (i + 1)))
+        index[t] = {f"doc{d:03d}": rng.choice([1, 1, 2, 3, 8]) for d in docs}
+    path = str(tmp_path / "index.idx")
+    write_binary_index(index, path)
+
+    for _ in range(200):
+        stems = rng.choices(terms, k=rng.randint(1, 4))
+        k = rng.choice([1, 3, 10])
+        got = top_k_documents(path, [], k, scorer, stems=stems)
+        expected = _brute_force(path, stems, k, scorer)
+        assert [d for d, _ in got] == [d for d, _ in expected], stems
+        assert [s for _, s in got] == pytest.approx([s for _, s in expected])
@@ -0,0 +1,20 @@
+import pytest
+
+from index_cache import IndexCache
+
+
+def test_failed_load_releases_its_loading_lock(tmp_path):
+    path = tmp_path / "index.txt"
+    path.write_text("cloud\tdoc1.txt:1\n", encoding="utf-8")
+    cache = IndexCache(1 << 20)
+
+    def broken(p):
+        raise ValueError("corrupt index")
+
+    with pytest.raises(ValueError):
+        cache.get(str(path), broken)
+    assert not cache._loading
+
+    assert cache.get(str(path), lambda p: "loaded") == "loaded"
+    assert not cache._loading
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,65 @@
+import random
+
+import index_pager
+from index_pager import TextPage, build_offset_index, seek_text, sorted_path
+
+
+def _write_index(path, terms):
+    path.write_text("".join(f"{t}\tdoc1.txt:1\n" for t in terms), encoding="utf-8")
+
+
+def _line_at(path, offset):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.readline().decode("utf-8")
+
+
+def test_unsorted_output_is_sorted_once_into_a_sidecar(tmp_path, monkeypatch):
+    # Small chunks, fan-in and stride: several merge passes and a sparse sample table
+    monkeypatch.setattr(index_pager, "SORT_CHUNK_BYTES", 500)
+    monkeypatch.setattr(index_pager, "SORT_FANIN", 3)
+    monkeypatch.setattr(index_pager, "OFFSET_INDEX_STRIDE", 400)
+    terms = [f"term{i:03d}" for i in range(300)]
+    random.Random(18).shuffle(terms)
+    path = tmp_path / "spark.txt"
+    _write_index(path, terms)
+
+    offsets = build_offset_index(str(path))
+    assert offsets.path == sorted_path(str(path))
+    lines = open(offsets.path, encoding="utf-8").read().splitlines()
+    assert lines == [f"{t}\tdoc1.txt:1" for t in sorted(terms)]
+    assert 0 < len(offsets.terms) < len(terms) // 10
+
+    assert _line_at(offsets.path, seek_text(offsets, "term1")).startswith("term100\t")
+    assert _line_at(offsets.path, seek_text(offsets, "term0995")).startswith("term100\t")
+    assert seek_text(offsets, "zzz") == offsets.size
+    page = list(TextPage(offsets.path, seek_text(offsets, "term298")))
+    assert [line.split("\t")[0] for line in page] == ["term298", "term299"]
+
+    # A fresh sidecar is reused; a rewritten index is sorted again
+    assert build_offset_index(str(path)).size == offsets.size
+    _write_index(path, ["b", "a"])
+    assert open(build_offset_index(str(path)).path).read() == "a\tdoc1.txt:1\nb\tdoc1.txt:1\n"
+
+
+def test_sorted_output_is_sampled_in_place(tmp_path):
+    terms = [f"a{i:03d}" for i in range(100)]
+    path = tmp_path / "nonparallel.txt"
+    _write_index(path, terms)
+
+    offsets = build_offset_index(str(path))
+    assert offsets.path == str(path)
+    assert not (tmp_path / "nonparallel.txt.sorted").exists()
+    assert _line_at(path, seek_text(offsets, "a05")).startswith("a050\t")
+    assert seek_text(offsets, "b") == offsets.size
+
+
+def test_hadoop_part_files_are_merged(tmp_path):
+    parts = [[f"a{i:03d}" for i in range(0, 60, 2)], [f"a{i:03d}" for i in range(1, 60, 2)]]
+    path = tmp_path / "hadoop.txt"
+    _write_index(path, parts[0] + parts[1])
+
+    offsets = build_offset_index(str(path))
+    assert offsets.path == sorted_path(str(path))
+    assert _line_at(offsets.path, seek_text(offsets, "a031")).startswith("a031\t")
+    assert _line_at(offsets.path, seek_text(offsets, "a0305")).startswith("a031\t")
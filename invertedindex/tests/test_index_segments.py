@@ -0,0 +1,45 @@
+import index_segments
+from query_index import stem
+from index_segments import SegmentedIndex, compact, read_manifest, update, write_segment
+
+
+def _write_docs(tmp_path, docs):
+    paths = []
+    for name, text in docs.items():
+        p = tmp_path / "docs" / name
+        p.parent.mkdir(exist_ok=True)
+        p.write_text(text, encoding="utf-8")
+        paths.append(str(p))
+    return paths
+
+
+def _build_base(tmp_path, docs):
+    # A base index in the query-side normalization, built the way a delta segment is
+    postings, lengths = {}, {}
+    for path in _write_docs(tmp_path, docs):
+        counts, _ = index_segments.index_document(path)
+        name = path.rsplit("/", 1)[-1]
+        for term, c in counts.items():
+            postings.setdefault(term, {})[name] = c
+        lengths[name] = sum(counts.values())
+    index_path = str(tmp_path / "index.txt")
+    write_segment(index_path, postings, lengths)
+    return index_path
+
+
+def test_update_without_manifest_keeps_base_documents(tmp_path):
+    index_path = _build_base(tmp_path, {"doc1.txt": "cloud storage", "doc2.txt": "cloud computing"})
+    new = _write_docs(tmp_path, {"doc6.txt": "cloud network"})
+
+    summary = update(index_path, new)
+
+    assert summary["added"] == 1
+    index = SegmentedIndex(index_path)
+    assert set(index["cloud"]) == {"doc1.txt", "doc2.txt", "doc6.txt"}
+    assert set(index[stem("storage")]) == {"doc1.txt"}
+    assert read_manifest(index_path)["docs"]["doc1.txt"]["path"] is None
+
+    # A later recheck leaves the untracked documents alone, and compaction keeps them
+    assert update(index_path)["segment"] is None
+    compact(index_path)
+    assert set(SegmentedIndex(index_path)["cloud"]) == {"doc1.txt", "doc2.txt", "doc6.txt"}
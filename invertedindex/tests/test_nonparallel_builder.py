@@ -0,0 +1,30 @@
+import os
+import random
+import subprocess
+import sys
+
+BUILDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                       "pythonNonParallel", "inverted_index_nonparallel.py")
+
+
+def _build(tmp_path, corpus, name, *opts):
+    out = tmp_path / name
+    subprocess.run([sys.executable, BUILDER, str(corpus), str(out), *opts], cwd=tmp_path, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return out.read_bytes()
+
+
+def test_memory_budget_build_handles_spaces_in_file_names(tmp_path):
+    rng = random.Random(6)
+    vocab = [f"w{i}x" for i in range(6000)]
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(40):
+        # Enough distinct terms per file that a 1 MB budget spills several runs
+        name = f"doc {i}: part {i % 3}.txt" if i % 2 else f"doc{i}.txt"
+        (corpus / name).write_text(" ".join(rng.choices(vocab, k=2000)), encoding="utf-8")
+
+    sequential = _build(tmp_path, corpus, "sequential.txt")
+    external = _build(tmp_path, corpus, "external.txt", "--memory-budget", "1")
+    assert b"doc 1: part 1.txt:" in sequential
+    assert external == sequential
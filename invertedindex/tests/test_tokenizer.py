@@ -0,0 +1,25 @@
+import random
+from io import StringIO
+
+import pytest
+
+from tokenizer import reference_tokenize, tokenize, tokenize_stream
+
+# Greek (with final-sigma contexts), punctuation that does not end a word for lower(), and whitespace
+ALPHABET = "aBz09ΑΣσςΟδ'’.-_ \n\t"
+
+
+@pytest.mark.parametrize("text", ["AΣ'B", "ΟΔΟΣ'. ΟΔΟΣ", "ΣΣΣ", "A Σ' Σ"])
+@pytest.mark.parametrize("chunk_size", range(1, 6))
+def test_stream_matches_whole_text_on_final_sigma(text, chunk_size):
+    assert list(tokenize_stream(StringIO(text), chunk_size)) == tokenize(text) == reference_tokenize(text)
+
+
+def test_stream_matches_whole_text_for_random_input():
+    rng = random.Random(8)
+    for _ in range(2000):
+        text = "".join(rng.choices(ALPHABET, k=rng.randrange(20)))
+        expected = reference_tokenize(text)
+        assert tokenize(text) == expected, text
+        for chunk_size in range(1, 8):
+            assert list(tokenize_stream(StringIO(text), chunk_size)) == expected, (text, chunk_size)
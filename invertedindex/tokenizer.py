@@ -0,0 +1,68 @@
+import re
+import sys
+from typing import Iterator, TextIO
+
+# A token is a maximal run of characters for which str.isalnum() is true, taken after
+# lowercasing. re's \w is exactly isalnum() plus "_", so [^\W_] keeps the same characters
+# the per-character loops in the builders used to keep, in a single C-level pass.
+_TOKEN_RE = re.compile(r"[^\W_]+")
+# Pure-ASCII text (the common case) takes a bytes.translate pass that lowercases and
+# blanks out non-alphanumerics at once, then a plain split.
+_ASCII_TABLE = bytes(
+    ord(chr(c).lower()) if chr(c).isalnum() else ord(" ") if c < 128 else c for c in range(256)
+)
+CHUNK_SIZE = 1 << 20
+
+def tokenize(text: str) -> list[str]:
+    if text.isascii():
+        return text.encode("ascii").translate(_ASCII_TABLE).decode("ascii").split()
+    return _TOKEN_RE.findall(text.lower())
+
+def _split_point(buf: str) -> int:
+    # Cut after the last whitespace: lower() is context-sensitive only for a final sigma,
+    # and that context never crosses whitespace, so each piece lowercases like the whole.
+    # Without whitespace nothing is safe to cut (punctuation does not end the context), so 0.
+    i = len(buf)
+    while i and not buf[i - 1].isspace():
+        i -= 1
+    return i
+
+def tokenize_stream(f: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    # The carry never holds whitespace, so only the new chunk needs scanning; a run without
+    # whitespace keeps growing the carry until one arrives
+    carry: list[str] = []
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        cut = _split_point(chunk)
+        if cut:
+            carry.append(chunk[:cut])
+            yield from tokenize("".join(carry))
+            carry = [chunk[cut:]]
+        else:
+            carry.append(chunk)
+    yield from tokenize("".join(carry))
+
+def reference_tokenize(text: str) -> list[str]:
+    # The original character loop, kept to check tokenize() against
+    return "".join(ch if ch.isalnum() else " " for ch in text.lower()).split()
+
+def verify(text: str, chunk_size: int = CHUNK_SIZE) -> bool:
+    expected = reference_tokenize(text)
+    if tokenize(text) != expected:
+        return False
+    from io import StringIO
+    return list(tokenize_stream(StringIO(text), chunk_size)) == expected
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <files...>  (check tokenize() against the reference loop)", file=sys.stderr)
+        sys.exit(1)
+    failed = False
+    for fp in sys.argv[1:]:
+        with open(fp, encoding="utf-8", errors="ignore") as f:
+            ok = verify(f.read())
+        print(f"{'OK  ' if ok else 'FAIL'} {fp}")
+        failed |= not ok
+    sys.exit(1 if failed else 0)
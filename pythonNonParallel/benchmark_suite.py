@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark suite: seeded synthetic corpora, warm-up and repeated trials per engine,
+and one JSON file of summary statistics that can be compared across engines and commits.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INVINDEX_DIR = os.path.join(HERE, os.pardir, 'invertedindex')
+NONPARALLEL_SCRIPT = os.path.join(HERE, 'inverted_index_nonparallel.py')
+OUTPUT_DIR = './benchmark_results'
+CORPUS_DIR = './benchmark_corpora'
+
+ENGINES = ('nonparallel', 'spark-local', 'hadoop-local', 'query')
+PERCENTILES = (50, 90, 95, 99)
+SUITE_VERSION = 1
+
+_CONSONANTS = 'bcdfghjklmnprstvwz'
+_VOWELS = 'aeiou'
+
+
+# ---------------------------------------------------------------------------
+# Corpus generation
+# ---------------------------------------------------------------------------
+
+def make_vocabulary(size: int, rng: random.Random) -> List[str]:
+    """Distinct pronounceable pseudo-words; list position is the Zipf rank."""
+    words, seen = [], set()
+    while len(words) < size:
+        syllables = rng.choices((1, 2, 3, 4), weights=(2, 5, 3, 1))[0]
+        word = ''.join(rng.choice(_CONSONANTS) + rng.choice(_VOWELS) for _ in range(syllables))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def zipf_cum_weights(size: int, s: float) -> List[float]:
+    total, cum = 0.0, []
+    for rank in range(1, size + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+def doc_length(rng: random.Random, mean: int, sigma: float) -> int:
+    # Log-normal with the requested mean; sigma 0 gives fixed-length documents
+    if sigma <= 0:
+        return mean
+    mu = math.log(mean) - sigma * sigma / 2
+    return max(1, int(rng.lognormvariate(mu, sigma)))
+
+
+def corpus_params(args) -> Dict:
+    return {'docs': args.docs, 'mean_length': args.mean_length, 'length_sigma': args.length_sigma,
+            'vocabulary': args.vocabulary, 'zipf_s': args.zipf_s, 'seed': args.seed}
+
+
+def generate_corpus(out_dir: str, params: Dict) -> Dict:
+    """Write params['docs'] documents to out_dir; the same params always give the same bytes.
+
+    A corpus.json next to the documents records the parameters, so an existing corpus is
+    reused instead of regenerated.
+    """
+    info_path = os.path.join(out_dir, 'corpus.json')
+    if os.path.exists(info_path):
+        with open(info_path, encoding='utf-8') as f:
+            info = json.load(f)
+        if info.get('params') == params:
+            return info
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    rng = random.Random(params['seed'])
+    vocab = make_vocabulary(params['vocabulary'], rng)
+    cum = zipf_cum_weights(len(vocab), params['zipf_s'])
+    total_bytes = total_tokens = 0
+    width = len(str(params['docs'] - 1))
+    for i in range(params['docs']):
+        n = doc_length(rng, params['mean_length'], params['length_sigma'])
+        words = rng.choices(vocab, cum_weights=cum, k=n)
+        # Short lines so line-oriented readers see realistic records
+        text = '\n'.join(' '.join(words[j:j + 12]) for j in range(0, n, 12)) + '\n'
+        with open(os.path.join(out_dir, f'doc{i:0{width}d}.txt'), 'w', encoding='utf-8') as f:
+            f.write(text)
+        total_bytes += len(text)
+        total_tokens += n
+
+    info = {'params': params, 'bytes': total_bytes, 'tokens': total_tokens,
+            'files': params['docs'], 'top_terms': vocab[:20]}
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+def corpus_files(corpus_dir: str) -> List[str]:
+    return sorted(os.path.join(corpus_dir, f) for f in os.listdir(corpus_dir) if f.endswith('.txt'))
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Linear interpolation between closest ranks (numpy's default)."""
+    if not sorted_values:
+        return float('nan')
+    k = (len(sorted_values) - 1) * p / 100
+    lo = math.floor(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(values: List[Optional[float]]) -> Optional[Dict]:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    n = len(values)
+    mean = sum(values) / n
+    stddev = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else 0.0
+    summary = {'n': n, 'mean': mean, 'stddev': stddev, 'min': values[0], 'max': values[-1]}
+    summary.update({f'p{p}': percentile(values, p) for p in PERCENTILES})
+    return summary
+
+
+# ---------------------------------------------------------------------------
+# Engines
+# ---------------------------------------------------------------------------
+
+def run_timed(cmd: List[str], cwd: str = None) -> Dict:
+    """Run a command to completion; wall time and the peak RSS of its process tree."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read()
+    # wait4 reports this child's own resource usage, unlike RUSAGE_CHILDREN's running maximum
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    rss_kb = usage.ru_maxrss if sys.platform != 'darwin' else usage.ru_maxrss / 1024
+    return {'wall_s': wall, 'peak_rss_mb': rss_kb / 1024, 'exit_code': proc.returncode,
+            'stderr_tail': stderr.decode('utf-8', 'replace')[-2000:] if proc.returncode else None}
+
+
+def nonparallel_runner(corpus_dir: str, workers: int) -> Callable[[str], Dict]:
+    def run(out_dir: str) -> Dict:
+        cmd = [sys.executable, NONPARALLEL_SCRIPT, corpus_dir, os.path.join(out_dir, 'index.txt'),
+               '--workers', str(workers)]
+        rec = run_timed(cmd, cwd=out_dir)
+        # The builder's own metrics split the wall time into phases
+        metrics_file = os.path.join(out_dir, 'index_metrics.json')
+        if rec['exit_code'] == 0 and os.path.exists(metrics_file):
+            with open(metrics_file, encoding='utf-8') as f:
+                metrics = json.load(f)
+            rec['phases'] = {p['name']: p['duration_s'] for p in metrics['phases']}
+            rec['tokens_per_s'] = metrics.get('tokens_per_s')
+            rec['gc_pause_s'] = metrics['gc']['pause_s']
+        return rec
+    return run
+
+
+def script_runner(script: str, corpus_dir: str, tail_args: List[str], opts: List[str] = ()) -> Callable[[str], Dict]:
+    # The build scripts call their helpers by relative path, so they run from invertedindex/
+    files = [os.path.abspath(f) for f in corpus_files(corpus_dir)]
+    def run(out_dir: str) -> Dict:
+        out = os.path.join(out_dir, 'index.txt')
+        return run_timed(['bash', script, '--local', *opts, *files, out, *tail_args], cwd=INVINDEX_DIR)
+    return run
+
+
+def run_trials(name: str, config: Dict, run: Callable[[str], Dict], warmup: int, trials: int,
+               corpus_bytes: int, keep_dir: str = None) -> Dict:
+    print(f"\n[{name}] {config}  ({warmup} warm-up, {trials} trials)")
+    records = []
+    for i in range(warmup + trials):
+        with tempfile.TemporaryDirectory(prefix='bench_') as out_dir:
+            rec = run(out_dir)
+            if keep_dir and i == warmup + trials - 1 and rec['exit_code'] == 0:
+                shutil.copytree(out_dir, keep_dir, dirs_exist_ok=True)
+        label = 'warm-up' if i < warmup else f'trial {i - warmup + 1}'
+        print(f"  {label}: {rec['wall_s']:.3f}s, peak RSS {rec['peak_rss_mb']:.1f} MB"
+              + ('' if rec['exit_code'] == 0 else f", exit code {rec['exit_code']}"))
+        if rec['exit_code'] != 0:
+            print(rec['stderr_tail'], file=sys.stderr)
+            return {'engine': name, 'config': config, 'status': 'failed', 'error': rec['stderr_tail']}
+        if i >= warmup:
+            rec['throughput_mb_s'] = corpus_bytes / 1024 / 1024 / rec['wall_s']
+            records.append(rec)
+    result = {
+        'engine': name, 'config': config, 'status': 'ok',
+        'trials': [{k: v for k, v in r.items() if k not in ('exit_code', 'stderr_tail')} for r in records],
+        'wall_s': summarize([r['wall_s'] for r in records]),
+        'peak_rss_mb': summarize([r['peak_rss_mb'] for r in records]),
+        'throughput_mb_s': summarize([r['throughput_mb_s'] for r in records]),
+    }
+    if all('phases' in r for r in records):
+        result['phases_s'] = {phase: summarize([r['phases'].get(phase) for r in records])
+                              for phase in records[0]['phases']}
+        result['tokens_per_s'] = summarize([r['tokens_per_s'] for r in records])
+        result['gc_pause_s'] = summarize([r['gc_pause_s'] for r in records])
+    return result
+
+
+def sample_queries(vocab: List[str], n: int, zipf_s: float, seed: int) -> List[str]:
+    """Query mix: 70% one to three words, 20% two-word AND, 10% prefix, Zipf-weighted terms."""
+    rng = random.Random(seed + 1)
+    cum = zipf_cum_weights(len(vocab), zipf_s)
+    queries = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.7:
+            queries.append(' '.join(rng.choices(vocab, cum_weights=cum, k=rng.randint(1, 3))))
+        elif kind < 0.9:
+            queries.append(' AND '.join(rng.choices(vocab, cum_weights=cum, k=2)))
+        else:
+            queries.append(rng.choices(vocab, cum_weights=cum)[0][:3] + '*')
+    return queries
+
+
+def run_query_trials(index_path: str, queries: List[str], scorers: List[str], k: int,
+                     warmup: int, trials: int) -> List[Dict]:
+    # In-process, through the same run_query the web UI and /api/search use
+    sys.path.insert(0, INVINDEX_DIR)
+    from index_cache import get_index, invalidate
+    from query_language import run_query
+
+    results = []
+    load_times = []
+    for _ in range(trials):
+        invalidate(index_path)
+        start = time.perf_counter()
+        get_index(index_path)
+        load_times.append(time.perf_counter() - start)
+    results.append({'engine': 'query', 'config': {'phase': 'index_load'}, 'status': 'ok',
+                    'wall_s': summarize(load_times)})
+    print(f"\n[query] index load: {summarize(load_times)['mean']:.3f}s mean over {trials}")
+
+    for scorer in scorers:
+        for q in queries[:max(warmup, 0) * 20]:
+            run_query(index_path, q, k, scorer)
+        latencies, qps = [], []
+        for _ in range(trials):
+            start = time.perf_counter()
+            for q in queries:
+                t0 = time.perf_counter()
+                run_query(index_path, q, k, scorer)
+                latencies.append((time.perf_counter() - t0) * 1000)
+            qps.append(len(queries) / (time.perf_counter() - start))
+        lat = summarize(latencies)
+        print(f"[query] {scorer}: {summarize(qps)['mean']:.0f} q/s, p50 {lat['p50']:.2f} ms, p99 {lat['p99']:.2f} ms")
+        results.append({'engine': 'query', 'config': {'scorer': scorer, 'k': k, 'queries': len(queries)},
+                        'status': 'ok', 'latency_ms': lat, 'qps': summarize(qps)})
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(r: Dict) -> str:
+    return f"{r['engine']} {json.dumps(r['config'], sort_keys=True)}"
+
+
+def headline(r: Dict) -> Optional[Dict]:
+    return r.get('wall_s') or r.get('latency_ms')
+
+
+def compare(results: List[Dict], baseline_path: str):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {result_key(r): r for r in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path} (mean; negative is faster):")
+    for r in results:
+        old = baseline.get(result_key(r))
+        new_s, old_s = headline(r), old and headline(old)
+        if not new_s or not old_s:
+            continue
+        change = 100 * (new_s['mean'] - old_s['mean']) / old_s['mean']
+        # Changes inside two standard deviations of either run are treated as noise
+        noise = 2 * max(new_s['stddev'], old_s['stddev'])
+        flag = '' if abs(new_s['mean'] - old_s['mean']) > noise else '  (within noise)'
+        print(f"  {result_key(r)}: {old_s['mean']:.4g} -> {new_s['mean']:.4g} ({change:+.1f}%){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the index builders and query path on a seeded synthetic corpus')
+    parser.add_argument('--engines', default='nonparallel,query',
+                        help=f"Comma-separated, from: {', '.join(ENGINES)} (default: nonparallel,query)")
+    parser.add_argument('--docs', type=int, default=2000, help='Documents in the corpus')
+    parser.add_argument('--mean-length', type=int, default=400, help='Mean document length in tokens')
+    parser.add_argument('--length-sigma', type=float, default=0.8,
+                        help='Log-normal sigma of document lengths (0: all documents the same length)')
+    parser.add_argument('--vocabulary', type=int, default=50000, help='Distinct words')
+    parser.add_argument('--zipf-s', type=float, default=1.1, help='Zipf exponent of word frequencies')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--corpus-dir', help=f'Where to generate the corpus (default: {CORPUS_DIR}/<params>)')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed runs before the trials')
+    parser.add_argument('--trials', type=int, default=5, help='Timed runs per configuration')
+    parser.add_argument('--workers', default='1', help='Comma-separated worker counts for the non-parallel builder')
+    parser.add_argument('--partitions', default='4', help='Comma-separated partition/reducer counts for Spark/Hadoop')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per query trial')
+    parser.add_argument('--scorers', default='counts,bm25', help='Comma-separated scorers for the query path')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--output', help=f'Results JSON (default: {OUTPUT_DIR}/suite_<timestamp>.json)')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    engines = [e.strip() for e in args.engines.split(',') if e.strip()]
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"unknown engine(s): {', '.join(sorted(unknown))}")
+
+    params = corpus_params(args)
+    corpus_dir = os.path.abspath(args.corpus_dir or os.path.join(
+        CORPUS_DIR, f"zipf_d{args.docs}_l{args.mean_length}_v{args.vocabulary}_s{args.zipf_s}_seed{args.seed}"))
+    start = time.perf_counter()
+    corpus = generate_corpus(corpus_dir, params)
+    print(f"Corpus {corpus_dir}: {corpus['files']} docs, {corpus['tokens']:,} tokens, "
+          f"{corpus['bytes'] / 1024 / 1024:.1f} MB (ready in {time.perf_counter() - start:.1f}s)")
+
+    results = []
+    query_index_dir = tempfile.mkdtemp(prefix='bench_query_')
+    try:
+        if 'nonparallel' in engines:
+            for w in (int(x) for x in args.workers.split(',')):
+                results.append(run_trials('nonparallel', {'workers': w}, nonparallel_runner(corpus_dir, w),
+                                          args.warmup, args.trials, corpus['bytes']))
+        for engine, script, tool in (('spark-local', 'build_index_spark.sh', 'spark-submit'),
+                                     ('hadoop-local', 'build_index.sh', 'hadoop')):
+            if engine not in engines:
+                continue
+            if shutil.which(tool) is None:
+                print(f"\n[{engine}] skipped: '{tool}' is not on PATH")
+                results.append({'engine': engine, 'config': {}, 'status': 'skipped',
+                                'error': f"'{tool}' is not on PATH"})
+                continue
+            for p in args.partitions.split(','):
+                tail = [p] if engine == 'spark-local' else [p, 'combiner']
+                results.append(run_trials(engine, {'partitions': int(p)}, script_runner(script, corpus_dir, tail),
+                                          args.warmup, args.trials, corpus['bytes']))
+        if 'query' in engines:
+            build = nonparallel_runner(corpus_dir, os.cpu_count() or 1)(query_index_dir)
+            if build['exit_code'] != 0:
+                sys.exit(f"Building the index for the query benchmark failed:\n{build['stderr_tail']}")
+            rng = random.Random(args.seed)
+            vocab = make_vocabulary(args.vocabulary, rng)
+            queries = sample_queries(vocab, args.queries, args.zipf_s, args.seed)
+            results.extend(run_query_trials(os.path.join(query_index_dir, 'index.txt'), queries,
+                                            args.scorers.split(','), args.k, args.warmup, args.trials))
+    finally:
+        shutil.rmtree(query_index_dir, ignore_errors=True)
+
+    report = {
+        'suite_version': SUITE_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'cpus': os.cpu_count()},
+        'corpus': {'dir': corpus_dir, **corpus},
+        'warmup': args.warmup,
+        'trials': args.trials,
+        'results': results,
+    }
+    output = args.output or os.path.join(OUTPUT_DIR, f"suite_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,39 @@
 import os
 import sys
 import time
-import glob
+import json
 import logging
 import psutil
 import argparse
+import tempfile
 from pathlib import Path
-from collections import defaultdict
-from typing import Dict, List, Set, Tuple
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
 import gc
-import tracemalloc
+import gzip
+import heapq
+import pickle
+import traceback
 from datetime import datetime
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The tokenizer and the sidecar writers are shared with the Spark job and the query side,
+# which live in ../invertedindex
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'invertedindex'))
+from tokenizer import tokenize
+from index_meta import write_meta
+from index_stats import write_stats
+from index_segments import init_manifest
+from query_index import POSITIONS_SUFFIX
+from phase_profiler import DEFAULT_INTERVAL, DEFAULT_TRACEMALLOC_FRAMES, PROFILE_LEVELS, make_profiler
+
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,47 +45,90 @@ logging.basicConfig(
 )
 logger = logging.getLogger('nonparallel-invindex')
 
+# Written next to <output>_report.txt for benchmark drivers to read instead of parsing logs
+METRICS_SUFFIX = '_metrics.json'
+METRICS_SCHEMA = 1
+PROMETHEUS_PREFIX = 'invindex_build'
+
+# Rough in-memory cost of the dict-of-dicts index, used to decide when to spill a sorted run
+BYTES_PER_TERM = 200
+BYTES_PER_POSTING = 100
+# Runs merged at once; more than this are merged in several passes to bound open files
+MAX_MERGE_FANIN = 128
+# Terms per pickled batch in a run; the merge holds one batch per open run
+RUN_BATCH_TERMS = 256
+
+# Output is formatted lazily and written in batches of this many lines through a large buffer
+WRITE_BATCH_LINES = 8192
+WRITE_BUFFER_BYTES = 1 << 20
+GZIP_LEVEL = 6
+
+# Files are read ahead on a thread pool while the main thread tokenizes; the window is
+# bounded in files and bytes so a few huge documents cannot pile up in memory.
+# With a single CPU the reader threads only contend with tokenization, so reads stay inline
+READ_THREADS = 4 if (os.cpu_count() or 1) > 1 else 1
+READ_AHEAD_FILES = 64
+READ_AHEAD_BYTES = 64 * 1024 * 1024
+
 
 class PerformanceMonitor:
 
-    def __init__(self):
+    def __init__(self, profile: str = 'off', profile_dir: str = None, profile_interval: float = DEFAULT_INTERVAL,
+                 tracemalloc_frames: int = DEFAULT_TRACEMALLOC_FRAMES):
         self.start_time = None
         self.end_time = None
         self.process = psutil.Process(os.getpid())
         self.start_memory = None
         self.max_memory = 0
         self.checkpoints = []
-        tracemalloc.start()
+        self.counters = {}
+        self.gc_pause = 0.0
+        self._gc_started = None
+        self.profiler = make_profiler(profile, profile_dir, profile_interval, tracemalloc_frames)
+        # Time spent writing profiles at checkpoints, kept out of the phase timings
+        self.profile_overhead = 0.0
 
     def start(self):
         self.start_time = time.time()
         self.start_memory = self.process.memory_info().rss / (1024 * 1024)
         self.max_memory = self.start_memory
+        gc.callbacks.append(self._on_gc)
+        self.profiler.start()
         logging.info(f"Starting performance monitoring. Initial memory: {self.start_memory:.2f} MB")
 
     def checkpoint(self, label: str):
         current_time = time.time()
         current_memory = self.process.memory_info().rss / (1024 * 1024)
-        snapshot = tracemalloc.take_snapshot()
-        top_stats = snapshot.statistics('lineno')
-        
         self.max_memory = max(self.max_memory, current_memory)
-        elapsed = current_time - self.start_time
+        elapsed = current_time - self.start_time - self.profile_overhead
+        
+        profile = self.profiler.end_phase(label)
+        self.profile_overhead += time.time() - current_time
         
         self.checkpoints.append({
             'label': label,
             'time_elapsed': elapsed,
             'memory_usage_mb': current_memory,
-            'top_memory_allocations': top_stats[:5]
+            'profile': profile
         })
         
         logging.info(f"CHECKPOINT [{label}] - Time: {elapsed:.3f}s, Memory: {current_memory:.2f} MB")
-        logging.debug(f"Top 5 memory allocations for [{label}]:")
-        for stat in top_stats[:5]:
+        for stat in profile.get('top_allocations', []):
             logging.debug(f"  {stat}")
 
+    def _on_gc(self, phase: str, info: Dict):
+        if phase == 'start':
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            self.gc_pause += time.perf_counter() - self._gc_started
+            self._gc_started = None
+
+    def record(self, **counters):
+        self.counters.update(counters)
+
     def end(self):
-        self.end_time = time.time()
+        self.profiler.stop()
+        self.end_time = time.time() - self.profile_overhead
         final_memory = self.process.memory_info().rss / (1024 * 1024)
         total_time = self.end_time - self.start_time
         
@@ -76,7 +141,8 @@ class PerformanceMonitor:
         logging.info(f"Memory increase: {final_memory - self.start_memory:.2f} MB")
         logging.info("=" * 60)
         
-        tracemalloc.stop()
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
         
         return {
             'total_time': total_time,
@@ -109,18 +175,101 @@ class PerformanceMonitor:
         
         logging.info(f"Performance report written to {output_file}")
 
+    def metrics(self) -> Dict:
+        total_time = self.end_time - self.start_time
+        phases, previous = [], 0.0
+        for cp in self.checkpoints:
+            phases.append({'name': cp['label'], 'duration_s': cp['time_elapsed'] - previous,
+                           'memory_usage_mb': cp['memory_usage_mb'], **cp['profile']})
+            previous = cp['time_elapsed']
+        
+        # Checkpoints only sample RSS; the kernel's high-water mark catches peaks between them
+        peak_rss = peak_children_rss = None
+        if resource is not None:
+            scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+            peak_children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+        
+        gc_stats = gc.get_stats()
+        metrics = {
+            'schema': METRICS_SCHEMA,
+            'implementation': 'python-nonparallel',
+            'generated': datetime.now().isoformat(timespec='seconds'),
+            'total_time_s': total_time,
+            'phases': phases,
+            **self.counters,
+            'memory': {
+                'initial_mb': self.start_memory,
+                'final_mb': self.process.memory_info().rss / (1024 * 1024),
+                'peak_sampled_mb': self.max_memory,
+                'peak_rss_mb': peak_rss,
+                'peak_worker_rss_mb': peak_children_rss,
+            },
+            'gc': {
+                'collections': [g['collections'] for g in gc_stats],
+                'collected': sum(g['collected'] for g in gc_stats),
+                'uncollectable': sum(g['uncollectable'] for g in gc_stats),
+                'pause_s': self.gc_pause,
+            },
+            'profile': {'level': self.profiler.level, 'dir': self.profiler.output_dir,
+                        'overhead_s': self.profile_overhead},
+        }
+        for name in ('tokens', 'bytes'):
+            if name in self.counters:
+                metrics[f'{name}_per_s'] = self.counters[name] / total_time if total_time > 0 else None
+        return metrics
+
+    def write_metrics(self, output_file: str, prometheus_file: str = None) -> Dict:
+        metrics = self.metrics()
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2)
+        logging.info(f"Metrics written to {output_file}")
+        if prometheus_file:
+            write_prometheus(metrics, prometheus_file)
+            logging.info(f"Prometheus metrics written to {prometheus_file}")
+        return metrics
+
+
+def write_prometheus(metrics: Dict, output_file: str):
+    # Text exposition format for node_exporter's textfile collector, which needs the file
+    # replaced atomically so it never scrapes a half-written one
+    def gauge(name: str, help_text: str, samples: List[Tuple[str, float]]):
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return []
+        lines = [f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}", f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge"]
+        lines.extend(f"{PROMETHEUS_PREFIX}_{name}{labels} {value}" for labels, value in samples)
+        return lines
+    
+    memory, gc_metrics = metrics['memory'], metrics['gc']
+    lines = []
+    lines += gauge('duration_seconds', 'Wall time of the whole build.', [('', metrics['total_time_s'])])
+    lines += gauge('phase_duration_seconds', 'Wall time per build phase.',
+                   [(f'{{phase="{p["name"]}"}}', p['duration_s']) for p in metrics['phases']])
+    for name, help_text in (('files', 'Input files found.'), ('documents', 'Documents in the index.'),
+                            ('bytes', 'Input bytes.'), ('tokens', 'Indexed tokens (stop words excluded).'),
+                            ('unique_terms', 'Distinct terms in the index.'),
+                            ('postings', 'Term-document pairs in the index.'),
+                            ('tokens_per_s', 'Indexed tokens per second of build time.'),
+                            ('bytes_per_s', 'Input bytes per second of build time.')):
+        lines += gauge(name, help_text, [('', metrics.get(name))])
+    lines += gauge('peak_rss_bytes', 'Peak resident set size.',
+                   [('{process="main"}', memory['peak_rss_mb'] and memory['peak_rss_mb'] * 1024 * 1024),
+                    ('{process="workers"}', memory['peak_worker_rss_mb'] and memory['peak_worker_rss_mb'] * 1024 * 1024)])
+    lines += gauge('gc_collections', 'Garbage collections per generation.',
+                   [(f'{{generation="{i}"}}', n) for i, n in enumerate(gc_metrics['collections'])])
+    lines += gauge('gc_collected', 'Objects collected by the garbage collector.', [('', gc_metrics['collected'])])
+    lines += gauge('gc_pause_seconds', 'Time spent in garbage collection.', [('', gc_metrics['pause_s'])])
+    
+    tmp_file = f"{output_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_file, output_file)
+
 
 def normalize_text(text: str) -> List[str]:
-    text = text.lower()
-    # Replace non-alphanumeric with space
-    chars = []
-    for ch in text:
-        if ch.isalnum():
-            chars.append(ch)
-        else:
-            chars.append(' ')
-    text = ''.join(chars)
-    return [token for token in text.split() if token]
+    # Lowercased runs of alphanumerics; see tokenizer.py for the equivalence guarantee
+    return tokenize(text)
 
 
 def load_stop_words(file_path: str = None) -> Set[str]:
@@ -152,18 +301,74 @@ def load_stop_words(file_path: str = None) -> Set[str]:
     return stop_words
 
 
-def read_file(file_path: str) -> str:
+def scan_input_files(input_dir: str) -> List[Tuple[str, os.stat_result]]:
+    # The files glob('<input_dir>/**/*.txt', recursive=True) finds, in the same order (a directory's
+    # files, then its subdirectories depth-first, hidden entries skipped), from one scandir pass.
+    # Order matters: a later file overwrites an earlier one with the same name.
+    files = []
+    pending = [input_dir]
+    while pending:
+        subdirs = []
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif entry.name.endswith('.txt') and entry.is_file():
+                    files.append((entry.path, entry.stat()))
+        pending.extend(reversed(subdirs))
+    return files
+
+
+def read_bytes(file_path: str) -> bytes:
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        # One unbuffered read, sized by fstat
+        with open(file_path, 'rb', buffering=0) as f:
             return f.read()
     except Exception as e:
         logging.error(f"Failed to read file {file_path}: {e}")
-        return ""
+        return b""
 
 
-def process_document(file_path: str, stop_words: Set[str]) -> Dict[str, int]:
+def read_file(file_path: str) -> str:
+    # One bulk decode. Unlike text mode, '\r' is kept, which the tokenizer treats as a separator all the same
+    return read_bytes(file_path).decode('utf-8', errors='ignore')
+
+
+def read_files(file_paths: List[str], threads: int = READ_THREADS) -> Iterator[Tuple[str, str]]:
+    # (path, content) in input order, with upcoming files read on a thread pool so I/O
+    # overlaps tokenization. The threads only read, which releases the GIL; decoding stays here
+    if threads <= 1:
+        for file_path in file_paths:
+            yield file_path, read_file(file_path)
+        return
+    
+    def size(file_path: str) -> int:
+        try:
+            return os.path.getsize(file_path)
+        except OSError:
+            return 0
+    
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='reader') as executor:
+        window = deque()
+        window_bytes = 0
+        for file_path in file_paths:
+            window.append((file_path, size(file_path), executor.submit(read_bytes, file_path)))
+            window_bytes += window[-1][1]
+            # Drain from the front once the window is full, keeping it topped up
+            while window and (len(window) >= READ_AHEAD_FILES or window_bytes >= READ_AHEAD_BYTES):
+                done_path, done_size, future = window.popleft()
+                window_bytes -= done_size
+                yield done_path, future.result().decode('utf-8', errors='ignore')
+        for done_path, _, future in window:
+            yield done_path, future.result().decode('utf-8', errors='ignore')
+
+
+def process_document(file_path: str, stop_words: Set[str], content: str = None) -> Dict[str, int]:
     filename = Path(file_path).name
-    content = read_file(file_path)
+    if content is None:
+        content = read_file(file_path)
     
     if not content:
         logging.warning(f"Empty content in {filename}")
@@ -180,21 +385,44 @@ def process_document(file_path: str, stop_words: Set[str]) -> Dict[str, int]:
     return dict(term_counts)
 
 
-def build_inverted_index(input_dir: str, stop_words: Set[str]) -> Dict[str, Dict[str, int]]:
+def process_document_positions(file_path: str, stop_words: Set[str], content: str = None) -> Dict[str, List[int]]:
+    filename = Path(file_path).name
+    if content is None:
+        content = read_file(file_path)
+    
+    if not content:
+        logging.warning(f"Empty content in {filename}")
+        return {}
+    
+    # Offsets count every token, stop words included, so adjacent query terms stay adjacent
+    tokens = normalize_text(content)
+    term_positions = defaultdict(list)
+    
+    for position, token in enumerate(tokens):
+        if token and token not in stop_words:
+            term_positions[token].append(position)
+    
+    logging.debug(f"Processed {filename}: found {len(tokens)} tokens, {len(term_positions)} unique terms")
+    return dict(term_positions)
+
+
+def index_files(file_paths: List[str], stop_words: Set[str],
+                positions: Dict[str, Dict[str, List[int]]] = None,
+                read_threads: int = READ_THREADS) -> Tuple[Dict[str, Dict[str, int]], int, int, int]:
     inverted_index = defaultdict(dict)
     file_count = 0
     empty_files = 0
     term_count = 0
     
-    # Expand pattern for all text files
-    pattern = os.path.join(input_dir, '**/*.txt')
-    all_files = glob.glob(pattern, recursive=True)
-    
-    logging.info(f"Found {len(all_files)} files to process in {input_dir}")
-    
-    for file_path in all_files:
+    for file_path, content in read_files(file_paths, read_threads):
         file_name = Path(file_path).name
-        term_frequencies = process_document(file_path, stop_words)
+        if positions is None:
+            term_frequencies = process_document(file_path, stop_words, content)
+        else:
+            term_positions = process_document_positions(file_path, stop_words, content)
+            for term, offsets in term_positions.items():
+                positions.setdefault(term, {})[file_name] = offsets
+            term_frequencies = {term: len(offsets) for term, offsets in term_positions.items()}
         
         if not term_frequencies:
             empty_files += 1
@@ -207,45 +435,315 @@ def build_inverted_index(input_dir: str, stop_words: Set[str]) -> Dict[str, Dict
         term_count += len(term_frequencies)
         
         if file_count % 100 == 0:
-            logging.info(f"Processed {file_count}/{len(all_files)} files...")
+            logging.info(f"Processed {file_count}/{len(file_paths)} files...")
+    
+    return dict(inverted_index), file_count, empty_files, term_count
+
+
+def index_shard(file_paths: List[str], stop_words: Set[str], with_positions: bool, read_threads: int):
+    positions = {} if with_positions else None
+    inverted_index, file_count, empty_files, term_count = index_files(file_paths, stop_words, positions, read_threads)
+    sorted_positions = sorted(positions.items()) if with_positions else None
+    return sorted(inverted_index.items()), sorted_positions, file_count, empty_files, term_count
+
+
+def merge_sorted_postings(runs: List[Iterable[Tuple[str, Dict]]]) -> Iterator[Tuple[str, Dict]]:
+    # Runs are given in file order and heapq.merge is stable, so on a shared file name
+    # later runs overwrite earlier ones exactly like the sequential loop does
+    current_term, current = None, None
+    for term, postings in heapq.merge(*runs, key=itemgetter(0)):
+        if term != current_term:
+            if current_term is not None:
+                yield current_term, current
+            current_term, current = term, dict(postings)
+        else:
+            current.update(postings)
+    if current_term is not None:
+        yield current_term, current
+
+
+def build_inverted_index_parallel(all_files: List[str], stop_words: Set[str], workers: int,
+                                  positions: Dict[str, Dict[str, List[int]]] = None,
+                                  read_threads: int = READ_THREADS):
+    # Several contiguous shards per worker keep the pool busy when file sizes are uneven
+    num_shards = min(len(all_files), workers * 4) or 1
+    shards = [all_files[i * len(all_files) // num_shards:(i + 1) * len(all_files) // num_shards]
+              for i in range(num_shards)]
+    logging.info(f"Indexing {len(all_files)} files in {num_shards} shards with {workers} workers")
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(index_shard, shards, repeat(stop_words), repeat(positions is not None),
+                                    repeat(read_threads)))
+    
+    inverted_index = dict(merge_sorted_postings([r[0] for r in results]))
+    if positions is not None:
+        positions.update(merge_sorted_postings([r[1] for r in results]))
+    file_count = sum(r[2] for r in results)
+    empty_files = sum(r[3] for r in results)
+    term_count = sum(r[4] for r in results)
+    return inverted_index, file_count, empty_files, term_count
+
+
+def write_run(postings: Iterable[Tuple[str, Dict[str, int]]], run_file: str) -> int:
+    # Pickled batches of (term, postings) records: doc names are file names and may hold
+    # spaces, colons or newlines, which a text run could not tell apart from its separators
+    terms = 0
+    with open(run_file, 'wb', buffering=WRITE_BUFFER_BYTES) as f:
+        batch = []
+        for record in postings:
+            batch.append(record)
+            if len(batch) == RUN_BATCH_TERMS:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                terms += len(batch)
+                batch = []
+        if batch:
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+            terms += len(batch)
+    return terms
+
+
+def read_run(run_file: str) -> Iterator[Tuple[str, Dict[str, int]]]:
+    with open(run_file, 'rb', buffering=WRITE_BUFFER_BYTES) as f:
+        while f.peek(1):
+            yield from pickle.load(f)
+
+
+def merge_runs(run_files: List[str], output_file: str, compression: str = 'none',
+               doc_lengths: Dict[str, int] = None, counters: Dict[str, int] = None) -> int:
+    merged = merge_sorted_postings([read_run(r) for r in run_files])
+    if doc_lengths is not None:
+        merged = count_doc_lengths(merged, doc_lengths, counters)
+    return write_lines((format_line(term, postings) + '\n' for term, postings in merged), output_file, compression)
+
+
+def merge_run_group(run_files: List[str], output_file: str) -> int:
+    # Intermediate merge pass: the result is read back as a run, so it stays in run format
+    return write_run(merge_sorted_postings([read_run(r) for r in run_files]), output_file)
+
+
+def build_inverted_index_external(all_files: List[str], stop_words: Set[str], memory_budget: int,
+                                  output_file: str, tmp_dir: str = None, compression: str = None,
+                                  doc_lengths: Dict[str, int] = None, counters: Dict[str, int] = None,
+                                  read_threads: int = READ_THREADS) -> int:
+    # Single-pass in-memory indexing: spill a sorted run whenever the estimated index size
+    # reaches the budget, then stream a k-way merge of the runs into output_file
+    logging.info(f"Memory budget for in-memory runs: {memory_budget / (1024 * 1024):.0f} MB")
+    
+    with tempfile.TemporaryDirectory(prefix='invindex_runs_', dir=tmp_dir) as run_dir:
+        run_files = []
+        
+        def spill(index: Dict[str, Dict[str, int]]):
+            run_file = os.path.join(run_dir, f"run_{len(run_files):05d}.run")
+            write_run(sorted(index.items()), run_file)
+            run_files.append(run_file)
+            logging.info(f"Spilled run {len(run_files)} with {len(index)} terms")
+        
+        inverted_index = defaultdict(dict)
+        posting_count = 0
+        file_count = 0
+        empty_files = 0
+        
+        for file_path, content in read_files(all_files, read_threads):
+            file_name = Path(file_path).name
+            term_frequencies = process_document(file_path, stop_words, content)
+            
+            if not term_frequencies:
+                empty_files += 1
+                continue
+            
+            for term, count in term_frequencies.items():
+                postings = inverted_index[term]
+                if file_name not in postings:
+                    posting_count += 1
+                postings[file_name] = count
+            
+            file_count += 1
+            if file_count % 100 == 0:
+                logging.info(f"Processed {file_count}/{len(all_files)} files...")
+            
+            if len(inverted_index) * BYTES_PER_TERM + posting_count * BYTES_PER_POSTING >= memory_budget:
+                spill(inverted_index)
+                inverted_index = defaultdict(dict)
+                posting_count = 0
+        
+        if inverted_index or not run_files:
+            spill(inverted_index)
+        del inverted_index
+        
+        logging.info(f"Completed processing {file_count} files "
+                    f"({empty_files} empty or failed)")
+        
+        # Merge consecutive groups so run order, and therefore overwrite order, is preserved
+        merge_pass = 0
+        while len(run_files) > MAX_MERGE_FANIN:
+            merge_pass += 1
+            merged = []
+            for i in range(0, len(run_files), MAX_MERGE_FANIN):
+                merged_file = os.path.join(run_dir, f"pass{merge_pass}_{len(merged):05d}.run")
+                merge_run_group(run_files[i:i + MAX_MERGE_FANIN], merged_file)
+                merged.append(merged_file)
+            run_files = merged
+        
+        unique_terms = merge_runs(run_files, output_file, compression_for(output_file, compression),
+                                  doc_lengths, counters)
+    
+    logging.info(f"Merged runs into {output_file} with {unique_terms} unique terms")
+    return unique_terms
+
+
+def build_inverted_index(all_files: List[str], stop_words: Set[str],
+                         positions: Dict[str, Dict[str, List[int]]] = None,
+                         workers: int = 1, read_threads: int = READ_THREADS) -> Dict[str, Dict[str, int]]:
+    if workers > 1:
+        inverted_index, file_count, empty_files, term_count = build_inverted_index_parallel(
+            all_files, stop_words, workers, positions, read_threads)
+    else:
+        inverted_index, file_count, empty_files, term_count = index_files(all_files, stop_words, positions,
+                                                                          read_threads)
     
     logging.info(f"Completed processing {file_count} files "
                 f"({empty_files} empty or failed)")
     logging.info(f"Built inverted index with {len(inverted_index)} unique terms "
                 f"and {term_count} total term occurrences")
     
-    return dict(inverted_index)
+    return inverted_index
 
 
-def format_output(inverted_index: Dict[str, Dict[str, int]]) -> List[str]:
-    output_lines = []
-    
+def count_doc_lengths(postings: Iterable[Tuple[str, Dict[str, int]]],
+                      doc_lengths: Dict[str, int], counters: Dict[str, int] = None) -> Iterator[Tuple[str, Dict[str, int]]]:
+    # Taken from the final postings, so a doc's length matches what the index holds for it
+    for term, docs in postings:
+        for doc, count in docs.items():
+            doc_lengths[doc] = doc_lengths.get(doc, 0) + count
+        if counters is not None:
+            counters['postings'] = counters.get('postings', 0) + len(docs)
+        yield term, docs
+
+
+def document_lengths(inverted_index: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    doc_lengths = {}
+    for docs in inverted_index.values():
+        for doc, count in docs.items():
+            doc_lengths[doc] = doc_lengths.get(doc, 0) + count
+    return doc_lengths
+
+
+def format_line(term: str, postings: Dict[str, int]) -> str:
+    posting_strings = [f"{doc}:{count}" for doc, count in sorted(postings.items())]
+    return f"{term}\t{' '.join(posting_strings)}"
+
+
+def iter_output_lines(inverted_index: Dict[str, Dict[str, int]]) -> Iterator[str]:
     for term, postings in sorted(inverted_index.items()):
-        posting_strings = [f"{doc}:{count}" for doc, count in sorted(postings.items())]
-        output_lines.append(f"{term}\t{' '.join(posting_strings)}")
-    
-    return output_lines
+        yield format_line(term, postings) + '\n'
+
+
+def compression_for(output_file: str, compression: str = None) -> str:
+    if compression:
+        return compression
+    if output_file.endswith('.gz'):
+        return 'gzip'
+    if output_file.endswith('.zst'):
+        return 'zstd'
+    return 'none'
+
+
+def open_output(output_file: str, compression: str = 'none'):
+    if compression == 'gzip':
+        return gzip.open(output_file, 'wt', encoding='utf-8', compresslevel=GZIP_LEVEL)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd output requires the 'zstandard' package (pip install zstandard)")
+        return zstandard.open(output_file, 'wt', encoding='utf-8')
+    return open(output_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_BYTES)
+
+
+def write_lines(lines: Iterable[str], output_file: str, compression: str = 'none') -> int:
+    line_count = 0
+    batch = []
+    with open_output(output_file, compression) as f:
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= WRITE_BATCH_LINES:
+                f.write(''.join(batch))
+                line_count += len(batch)
+                batch.clear()
+        f.write(''.join(batch))
+        line_count += len(batch)
+    return line_count
 
 
-def write_output(inverted_index: Dict[str, Dict[str, int]], output_file: str):
-    output_lines = format_output(inverted_index)
+def write_output(inverted_index: Dict[str, Dict[str, int]], output_file: str, compression: str = None):
+    try:
+        line_count = write_lines(iter_output_lines(inverted_index), output_file,
+                                 compression_for(output_file, compression))
+        logging.info(f"Wrote {line_count} lines to {output_file}")
+    except Exception as e:
+        logging.error(f"Failed to write to {output_file}: {e}")
+
+
+def write_positions(positions: Dict[str, Dict[str, List[int]]], output_file: str):
+    def lines():
+        for term, postings in sorted(positions.items()):
+            posting_strings = [f"{doc}:{','.join(map(str, offsets))}" for doc, offsets in sorted(postings.items())]
+            yield f"{term}\t{' '.join(posting_strings)}\n"
     
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for line in output_lines:
-                f.write(line + '\n')
-        logging.info(f"Wrote {len(output_lines)} lines to {output_file}")
+        write_lines(lines(), output_file)
+        logging.info(f"Wrote positions for {len(positions)} terms to {output_file}")
     except Exception as e:
         logging.error(f"Failed to write to {output_file}: {e}")
 
 
+def write_index_sidecars(output_file: str, stop_words_file: str, doc_lengths: Dict[str, int],
+                         files: List[Tuple[str, os.stat_result]]):
+    # Metadata, statistics and manifest, written by the invertedindex modules that read them
+    # Terms are lowercased tokens without stemming, so query-side loaders still normalize them
+    stop_words = f"file:{Path(stop_words_file).name}" if stop_words_file else 'nonparallel-default-v1'
+    try:
+        write_meta(output_file, normalization={'stemmer': None, 'stop_words': stop_words})
+        write_stats(output_file, doc_lengths)
+        # The stat results come from the input scan, so the manifest costs no further stat calls
+        init_manifest(output_file, [file_path for file_path, _ in files], dict(files))
+    except Exception as e:
+        logging.error(f"Failed to write index sidecars for {output_file}: {e}")
+
+
 def main():
     parser = argparse.ArgumentParser(description='Non-parallel inverted index builder')
     parser.add_argument('input_dir', help='Input directory containing documents')
     parser.add_argument('output_file', help='Output file for inverted index')
     parser.add_argument('--stop-words', help='Path to stop words file (optional)')
+    parser.add_argument('--positions', action='store_true',
+                        help=f'Also write token positions to <output_file>{POSITIONS_SUFFIX} for phrase matching')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes; output is identical to the sequential build (default: 1)')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='Bound memory by spilling sorted runs to disk and merging them (external sort)')
+    parser.add_argument('--tmp-dir', help='Directory for spilled runs (default: system temp dir)')
+    parser.add_argument('--read-threads', type=int, default=READ_THREADS, metavar='N',
+                        help='Threads reading upcoming files while the current one is indexed, per worker process; '
+                             '1 reads inline (default: 4, or 1 on a single-CPU host)')
+    parser.add_argument('--compress', choices=['none', 'gzip', 'zstd'],
+                        help='Compress the index file (default: inferred from a .gz/.zst output extension)')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help=f'Where to write the metrics JSON (default: <output_file base>{METRICS_SUFFIX})')
+    parser.add_argument('--prometheus', metavar='FILE',
+                        help='Also write the metrics in Prometheus text format (e.g. for the node_exporter textfile collector)')
+    parser.add_argument('--profile', choices=PROFILE_LEVELS, default='off',
+                        help='Per-phase profiling with folded-stack (flame graph) output (default: off)')
+    parser.add_argument('--profile-interval', type=float, default=DEFAULT_INTERVAL, metavar='SECONDS',
+                        help=f'Sampling interval of --profile sampler (default: {DEFAULT_INTERVAL})')
+    parser.add_argument('--tracemalloc-frames', type=int, default=DEFAULT_TRACEMALLOC_FRAMES, metavar='N',
+                        help=f'Stack depth recorded by --profile tracemalloc; slower when deeper (default: {DEFAULT_TRACEMALLOC_FRAMES})')
+    parser.add_argument('--profile-dir', help='Where profiles go (default: <output_file base>_profile)')
     args = parser.parse_args()
     
+    if args.memory_budget is not None and (args.workers > 1 or args.positions):
+        parser.error('--memory-budget cannot be combined with --workers or --positions')
+    
     if not os.path.isdir(args.input_dir):
         logging.error(f"Input directory doesn't exist: {args.input_dir}")
         sys.exit(1)
@@ -255,27 +753,55 @@ def main():
         os.makedirs(output_dir)
         logging.info(f"Created output directory: {output_dir}")
     
-    monitor = PerformanceMonitor()
+    profile_dir = args.profile_dir or f"{os.path.splitext(args.output_file)[0]}_profile"
+    monitor = PerformanceMonitor(args.profile, profile_dir, args.profile_interval, args.tracemalloc_frames)
     monitor.start()
     
     monitor.checkpoint("Init")
+    # Listed once, with the stat results the manifest and the metrics reuse
+    scanned = scan_input_files(args.input_dir)
+    input_files = [file_path for file_path, _ in scanned]
+    logging.info(f"Found {len(input_files)} files to process in {args.input_dir}")
     stop_words = load_stop_words(args.stop_words)
     monitor.checkpoint("Load stop words")
     
-    inverted_index = build_inverted_index(args.input_dir, stop_words)
-    monitor.checkpoint("Build index")
-    
-    write_output(inverted_index, args.output_file)
-    monitor.checkpoint("Write output")
+    if args.memory_budget is not None:
+        doc_lengths = {}
+        counters = {}
+        unique_terms = build_inverted_index_external(
+            input_files, stop_words, args.memory_budget * 1024 * 1024, args.output_file, args.tmp_dir, args.compress,
+            doc_lengths, counters, args.read_threads)
+        postings = counters.get('postings', 0)
+        write_index_sidecars(args.output_file, args.stop_words, doc_lengths, scanned)
+        monitor.checkpoint("Build and merge runs")
+    else:
+        positions = {} if args.positions else None
+        inverted_index = build_inverted_index(input_files, stop_words, positions, args.workers, args.read_threads)
+        monitor.checkpoint("Build index")
+        
+        write_output(inverted_index, args.output_file, args.compress)
+        if positions is not None:
+            write_positions(positions, args.output_file + POSITIONS_SUFFIX)
+        doc_lengths = document_lengths(inverted_index)
+        write_index_sidecars(args.output_file, args.stop_words, doc_lengths, scanned)
+        unique_terms = len(inverted_index)
+        postings = sum(len(docs) for docs in inverted_index.values())
+        del inverted_index
+        monitor.checkpoint("Write output")
     
     gc.collect()
     monitor.checkpoint("Final cleanup")
     stats = monitor.end()
     
-    monitor.generate_report(f"{os.path.splitext(args.output_file)[0]}_report.txt")
+    output_base = os.path.splitext(args.output_file)[0]
+    monitor.generate_report(f"{output_base}_report.txt")
+    monitor.record(files=len(input_files), documents=len(doc_lengths),
+                   bytes=sum(st.st_size for _, st in scanned), tokens=sum(doc_lengths.values()),
+                   unique_terms=unique_terms, postings=postings)
+    monitor.write_metrics(args.metrics or output_base + METRICS_SUFFIX, args.prometheus)
     
-    print(f"\nProcessed {len(glob.glob(os.path.join(args.input_dir, '**/*.txt'), recursive=True))} files")
-    print(f"Found {len(inverted_index)} unique terms")
+    print(f"\nProcessed {len(input_files)} files")
+    print(f"Found {unique_terms} unique terms")
     print(f"Inverted index saved to {args.output_file}")
     print(f"Total execution time: {stats['total_time']:.3f} seconds")
     print(f"Peak memory usage: {stats['peak_memory_mb']:.2f} MB")
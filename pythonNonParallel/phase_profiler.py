@@ -0,0 +1,243 @@
+"""
+Per-phase profilers for PerformanceMonitor.
+
+Every level writes one folded-stack file per phase (``<NN>_<phase>.folded``, one
+"frame;frame;frame weight" line per stack), which flamegraph.pl, speedscope and
+inferno read directly:
+
+- off:         nothing; the default, so benchmark timings carry no profiling cost
+- sampler:     a background thread samples the main thread's stack and the process RSS/CPU
+               every interval (weights are sample counts; RSS/CPU also go to samples.csv)
+- tracemalloc: allocation growth per phase by allocating stack (weights are bytes)
+- cprofile:    deterministic profile per phase (<phase>.prof for pstats/snakeviz, and
+               folded stacks rebuilt from the caller graph; weights are microseconds)
+"""
+
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Dict, Tuple
+
+import psutil
+
+PROFILE_LEVELS = ('off', 'sampler', 'tracemalloc', 'cprofile')
+DEFAULT_INTERVAL = 0.01
+# Frames kept per allocation traceback; tracing cost grows about linearly with depth
+DEFAULT_TRACEMALLOC_FRAMES = 4
+# Caller-graph walks stop below this many seconds or this depth, which bounds recursive code
+CPROFILE_MIN_SECONDS = 1e-5
+CPROFILE_MAX_DEPTH = 64
+
+
+def _slug(label: str) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_').lower() or 'phase'
+
+
+def _code_label(filename: str, name: str) -> str:
+    return f"{os.path.basename(filename)}:{name}"
+
+
+def write_folded(stacks: Dict[str, float], output_file: str):
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for stack, weight in sorted(stacks.items()):
+            if weight >= 1:
+                f.write(f"{stack} {int(weight)}\n")
+
+
+class PhaseProfiler:
+    """Level 'off': every hook is a no-op."""
+    level = 'off'
+
+    def __init__(self, output_dir: str = None, interval: float = DEFAULT_INTERVAL,
+                 frames: int = DEFAULT_TRACEMALLOC_FRAMES):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.frames = frames
+        self.phase_count = 0
+
+    def start(self):
+        pass
+
+    def end_phase(self, label: str) -> Dict:
+        return {}
+
+    def stop(self):
+        pass
+
+    def _phase_file(self, label: str, suffix: str) -> str:
+        return os.path.join(self.output_dir, f"{self.phase_count + 1:02d}_{_slug(label)}{suffix}")
+
+    def _next_phase(self, label: str, stacks: Dict[str, float]) -> str:
+        path = self._phase_file(label, '.folded')
+        write_folded(stacks, path)
+        self.phase_count += 1
+        return path
+
+
+class SamplingProfiler(PhaseProfiler):
+    level = 'sampler'
+
+    def __init__(self, output_dir: str, interval: float = DEFAULT_INTERVAL, frames: int = DEFAULT_TRACEMALLOC_FRAMES):
+        super().__init__(output_dir, interval, frames)
+        self.process = psutil.Process(os.getpid())
+        self.main_thread = threading.main_thread().ident
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.stacks = Counter()
+        self.samples = []
+        self.phase_samples = []
+        self.t0 = None
+
+    def start(self):
+        self.t0 = time.perf_counter()
+        self.process.cpu_percent()  # First call only sets the baseline
+        self.thread = threading.Thread(target=self._run, name='phase-sampler', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.main_thread)
+            stack = []
+            while frame is not None:
+                stack.append(_code_label(frame.f_code.co_filename, frame.f_code.co_name))
+                frame = frame.f_back
+            sample = (time.perf_counter() - self.t0, self.process.memory_info().rss / (1024 * 1024),
+                      self.process.cpu_percent())
+            with self.lock:
+                if stack:
+                    self.stacks[';'.join(reversed(stack))] += 1
+                self.phase_samples.append(sample)
+
+    def end_phase(self, label: str) -> Dict:
+        with self.lock:
+            stacks, self.stacks = self.stacks, Counter()
+            samples, self.phase_samples = self.phase_samples, []
+        self.samples.extend((label,) + s for s in samples)
+        summary = {'samples': len(samples), 'folded': self._next_phase(label, stacks)}
+        if samples:
+            summary['peak_rss_mb'] = max(s[1] for s in samples)
+            summary['mean_cpu_percent'] = sum(s[2] for s in samples) / len(samples)
+        return summary
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        with open(os.path.join(self.output_dir, 'samples.csv'), 'w', encoding='utf-8') as f:
+            f.write('phase,time_s,rss_mb,cpu_percent\n')
+            for label, t, rss, cpu in self.samples:
+                f.write(f'"{label}",{t:.4f},{rss:.2f},{cpu:.1f}\n')
+
+
+class TracemallocProfiler(PhaseProfiler):
+    level = 'tracemalloc'
+
+    def __init__(self, output_dir: str, interval: float = DEFAULT_INTERVAL, frames: int = DEFAULT_TRACEMALLOC_FRAMES):
+        super().__init__(output_dir, interval, frames)
+        self.previous = None
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self.previous = self._snapshot()
+
+    def end_phase(self, label: str) -> Dict:
+        snapshot = self._snapshot()
+        # Memory a phase left allocated, attributed to the stacks that allocated it
+        stacks = Counter()
+        for stat in snapshot.compare_to(self.previous, 'traceback'):
+            if stat.size_diff > 0:
+                stacks[';'.join(_code_label(f.filename, str(f.lineno)) for f in stat.traceback)] += stat.size_diff
+        self.previous = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return {'traced_mb': current / (1024 * 1024), 'traced_peak_mb': peak / (1024 * 1024),
+                'top_allocations': [str(s) for s in snapshot.statistics('lineno')[:5]],
+                'folded': self._next_phase(label, stacks)}
+
+    def stop(self):
+        tracemalloc.stop()
+
+
+def pstats_folded(stats: Dict) -> Dict[str, float]:
+    """Folded stacks from cProfile's caller graph, in microseconds.
+
+    cProfile keeps only caller->callee edges, so a function's own time is split across its
+    callers in proportion to the cumulative time each edge contributed.
+    """
+    children = defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children[caller].append((func, edge[3]))
+    stacks = Counter()
+
+    def walk(func: Tuple, path: Tuple, share: float):
+        _, _, tottime, cumtime, _ = stats[func]
+        path = path + (func,)
+        if tottime * share > 0:
+            stacks[';'.join(_code_label(f[0], f[2]) for f in path)] += tottime * share * 1e6
+        if len(path) >= CPROFILE_MAX_DEPTH:
+            return
+        for child, edge_time in children.get(func, ()):
+            child_time = stats[child][3]
+            child_share = share * edge_time / child_time if child_time else 0
+            if child not in path and child_share * child_time >= CPROFILE_MIN_SECONDS:
+                walk(child, path, child_share)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, (), 1.0)
+    return stacks
+
+
+class CProfileProfiler(PhaseProfiler):
+    level = 'cprofile'
+
+    def __init__(self, output_dir: str, interval: float = DEFAULT_INTERVAL, frames: int = DEFAULT_TRACEMALLOC_FRAMES):
+        super().__init__(output_dir, interval, frames)
+        self.profile = None
+
+    def start(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def end_phase(self, label: str) -> Dict:
+        self.profile.disable()
+        stats = pstats.Stats(self.profile)
+        prof_file = self._phase_file(label, '.prof')
+        stats.dump_stats(prof_file)
+        summary = {'calls': stats.total_calls, 'prof': prof_file,
+                   'folded': self._next_phase(label, pstats_folded(stats.stats))}
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return summary
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+
+
+_PROFILERS = {p.level: p for p in (PhaseProfiler, SamplingProfiler, TracemallocProfiler, CProfileProfiler)}
+
+
+def make_profiler(level: str, output_dir: str = None, interval: float = DEFAULT_INTERVAL,
+                  frames: int = DEFAULT_TRACEMALLOC_FRAMES) -> PhaseProfiler:
+    if level not in _PROFILERS:
+        raise ValueError(f"Unknown profile level {level!r}; expected one of {', '.join(PROFILE_LEVELS)}")
+    if level != 'off':
+        os.makedirs(output_dir, exist_ok=True)
+        logging.info(f"Profiling level '{level}', writing to {output_dir}")
+    return _PROFILERS[level](output_dir, interval, frames)
@@ -75,6 +75,26 @@ def extract_performance_info(stdout, output_file):
         'peak_memory_mb': None
     }
     
+    # Builders that write <output>_metrics.json report exact numbers; log parsing is the fallback
+    metrics_file = f"{os.path.splitext(output_file)[0]}_metrics.json"
+    if os.path.exists(metrics_file):
+        try:
+            with open(metrics_file, 'r') as f:
+                metrics = json.load(f)
+            info.update({
+                'files_processed': metrics['files'],
+                'unique_terms': metrics['unique_terms'],
+                'peak_memory_mb': metrics['memory']['peak_rss_mb'] or metrics['memory']['peak_sampled_mb'],
+                'postings': metrics['postings'],
+                'tokens_per_s': metrics.get('tokens_per_s'),
+                'bytes_per_s': metrics.get('bytes_per_s'),
+                'phases': {p['name']: p['duration_s'] for p in metrics['phases']},
+                'gc_pause_s': metrics['gc']['pause_s'],
+            })
+            return info
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Could not read metrics file: {e}")
+    
     lines = stdout.split('\n') if stdout else []
     
     for line in lines:
@@ -136,10 +136,10 @@ def run_spark_benchmark(input_files, output_file, partitions=2):
     return result
 
 
-def run_python_benchmark(input_dir, output_file):
-    """Run non-parallel Python benchmark."""
-    cmd = [sys.executable, PYTHON_SCRIPT, input_dir, output_file]
-    description = f"Non-parallel Python benchmark"
+def run_python_benchmark(input_dir, output_file, workers=1):
+    """Run non-parallel Python benchmark (optionally sharded across worker processes)."""
+    cmd = [sys.executable, PYTHON_SCRIPT, input_dir, output_file, '--workers', str(workers)]
+    description = f"Non-parallel Python benchmark with {workers} worker(s)"
     
     result = run_command(cmd, description)
     
@@ -174,7 +174,8 @@ def find_dataset_folders(base_dir):
     return sorted(datasets, key=lambda x: x['size_mb'])
 
 
-def run_benchmarks(datasets, reducers_list, include_hadoop=True, include_spark=True, include_python=True):
+def run_benchmarks(datasets, reducers_list, include_hadoop=True, include_spark=True, include_python=True,
+                   python_workers=(1,)):
     """Run benchmarks for all implementations on all datasets."""
     results = []
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -241,26 +242,29 @@ def run_benchmarks(datasets, reducers_list, include_hadoop=True, include_spark=T
                     'output_file': output_file
                 })
         
-        # Non-parallel Python benchmark (once per dataset, no reducers)
+        # Non-parallel Python benchmark (once per dataset and worker count, no reducers)
         if include_python:
-            output_file = os.path.join(
-                OUTPUT_DIR, 
-                f"{timestamp}_{dataset_name}_python.txt"
-            )
-            
-            print(f"\nRunning non-parallel Python benchmark...")
-            result = run_python_benchmark(dataset_path, output_file)
-            
-            results.append({
-                'dataset': dataset_name,
-                'size_mb': dataset_size,
-                'implementation': 'python',
-                'reducers': None,
-                'execution_time': result['execution_time'],
-                'memory_mb': result.get('memory_mb'),
-                'exit_code': result['exit_code'],
-                'output_file': output_file
-            })
+            for workers in python_workers:
+                implementation = 'python' if workers == 1 else 'python_parallel'
+                run_name = implementation if workers == 1 else f"{implementation}_{workers}"
+                output_file = os.path.join(
+                    OUTPUT_DIR, 
+                    f"{timestamp}_{dataset_name}_{run_name}.txt"
+                )
+                
+                print(f"\nRunning Python benchmark ({workers} workers)...")
+                result = run_python_benchmark(dataset_path, output_file, workers=workers)
+                
+                results.append({
+                    'dataset': dataset_name,
+                    'size_mb': dataset_size,
+                    'implementation': implementation,
+                    'reducers': workers,
+                    'execution_time': result['execution_time'],
+                    'memory_mb': result.get('memory_mb'),
+                    'exit_code': result['exit_code'],
+                    'output_file': output_file
+                })
     
     return results
 
@@ -364,6 +368,7 @@ def main():
     parser.add_argument('--no-hadoop', action='store_true', help='Skip Hadoop benchmarks')
     parser.add_argument('--no-spark', action='store_true', help='Skip Spark benchmarks')
     parser.add_argument('--no-python', action='store_true', help='Skip Python benchmarks')
+    parser.add_argument('--python-workers', default='1', help='Comma-separated list of Python builder worker counts')
     args = parser.parse_args()
     
     # Ensure output directory exists
@@ -388,7 +393,8 @@ def main():
         reducers_list,
         include_hadoop=not args.no_hadoop,
         include_spark=not args.no_spark,
-        include_python=not args.no_python
+        include_python=not args.no_python,
+        python_workers=[int(w) for w in args.python_workers.split(',')]
     )
     
     # Save results